@@ -0,0 +1,182 @@
+import argparse
+import io
+import json
+import os
+import sys
+import tarfile
+import tempfile
+import time
+import tracemalloc
+
+from main import ShellSession, flush_logs, load_vfs, log, log_json
+
+CASES = ("wide", "deep", "million")
+DEEP_DEPTH = 100
+
+
+def synthetic_names(case: str, entries: int):
+	"""
+	Generate member names of a synthetic archive.
+
+	:param case: ``wide`` (one directory with many files), ``deep`` (chains of
+		``DEEP_DEPTH`` nested directories with a few files each) or ``million`` (a balanced tree)
+	:type case: str
+	:param entries: Approximate number of members
+	:type entries: int
+	:return: ``(name, is_dir)`` tuples in archive order
+	:rtype: Iterator[tuple[str, bool]]
+	"""
+	if case == "wide":
+		yield "wide", True
+		for i in range(entries - 1):
+			yield f"wide/file_{i}.txt", False
+	elif case == "deep":
+		for chain in range(max(1, entries // (DEEP_DEPTH * 4))):
+			path = f"c{chain}/"
+			yield path.rstrip("/"), True
+			for depth in range(DEEP_DEPTH - 1):
+				path = f"{path}d{depth}/"
+				yield path.rstrip("/"), True
+				for j in range(3):
+					yield f"{path}f{j}.txt", False
+	else:
+		# 100 top-level directories with 100 subdirectories each, files below them
+		per_leaf = max(1, entries // 10000)
+		for top in range(100):
+			yield f"t{top}", True
+			for sub in range(100):
+				yield f"t{top}/s{sub}", True
+				for i in range(per_leaf):
+					yield f"t{top}/s{sub}/f{i}.txt", False
+
+
+def make_archive(path: str, case: str, entries: int):
+	"""Write a synthetic tar archive with small files."""
+	data = b"payload\n"
+	with tarfile.open(path, "w") as tar:
+		for name, is_dir in synthetic_names(case, entries):
+			info = tarfile.TarInfo(name)
+			if is_dir:
+				info.type = tarfile.DIRTYPE
+				tar.addfile(info)
+			else:
+				info.size = len(data)
+				tar.addfile(info, io.BytesIO(data))
+
+
+def timed(function, repeat: int = 1):
+	"""Return the best wall time of ``repeat`` calls in seconds."""
+	best = float("inf")
+	for _ in range(repeat):
+		start = time.perf_counter()
+		function()
+		best = min(best, time.perf_counter() - start)
+	return best
+
+
+def deepest_dir(index):
+	"""Return the path of the deepest directory reachable by always taking the first subdirectory."""
+	node = index.root
+	while True:
+		index.load(node)
+		subdirs = [child for child in node.sorted_children() if child.is_dir]
+		if not subdirs:
+			return node.path
+		node = subdirs[0]
+
+
+def bench_case(directory: str, case: str, entries: int, repeat: int):
+	"""
+	Run every measurement for one synthetic archive.
+
+	:return: The measurements, times in seconds and memory in bytes
+	:rtype: dict
+	"""
+	archive = os.path.join(directory, f"{case}.tar")
+	start = time.perf_counter()
+	make_archive(archive, case, entries)
+	result = {"case": case, "generate_s": time.perf_counter() - start, "archive_bytes": os.path.getsize(archive)}
+
+	cache = archive + ".idx"
+
+	def cold():
+		if os.path.exists(cache):
+			os.remove(cache)
+		load_vfs(archive)
+
+	result["load_cold_s"] = timed(cold)
+	result["load_warm_s"] = timed(lambda: load_vfs(archive), repeat)
+	result["load_warm_full_s"] = timed(lambda: load_vfs(archive).load_all(), repeat)
+
+	os.remove(cache)
+	tracemalloc.start()
+	index = load_vfs(archive)
+	result["load_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	result["entries"] = index.size
+
+	log_file = os.path.join(directory, f"{case}.jsonl")
+	shell = ShellSession(index, log_file)
+	target = deepest_dir(index)
+	result["ls_root_s"] = timed(lambda: shell.execute("ls /"), repeat)
+	result["cd_deepest_s"] = timed(lambda: shell.execute("cd /" + target), repeat)
+	result["ls_deepest_s"] = timed(lambda: shell.execute("ls"), repeat)
+	result["tree_root_s"] = timed(lambda: shell.execute("tree /"), repeat)
+	flush_logs()
+	return result
+
+
+def bench_log(directory: str, commands: int):
+	"""
+	Measure the cost per command of the JSON Lines log and of the legacy JSON log.
+
+	:return: Mean seconds per command of both backends
+	:rtype: dict
+	"""
+	jsonl_path = os.path.join(directory, "bench.jsonl")
+	start = time.perf_counter()
+	for i in range(commands):
+		log(f"echo {i}", jsonl_path)
+	flush_logs()
+	jsonl = (time.perf_counter() - start) / commands
+
+	json_path = os.path.join(directory, "bench.json")
+	open(json_path, "w").close()
+	start = time.perf_counter()
+	for i in range(commands):
+		log_json(f"echo {i}", json_path)
+	legacy = (time.perf_counter() - start) / commands
+	return {"commands": commands, "jsonl_per_command_s": jsonl, "json_per_command_s": legacy}
+
+
+def main():
+	"""Run the benchmarks and print the results as JSON."""
+	parser = argparse.ArgumentParser(description="Benchmarks of the OS Shell Emulator")
+	parser.add_argument("--cases", nargs="+", choices=CASES, default=["wide", "deep"], help="Archives to generate")
+	parser.add_argument("--entries", type=int, default=20000, help="Members of the wide and deep archives")
+	parser.add_argument("--million_entries", type=int, default=1000000, help="Members of the million archive")
+	parser.add_argument("--repeat", type=int, default=5, help="Repetitions, the best time is reported")
+	parser.add_argument("--log_commands", type=int, default=1000, help="Commands written by the log benchmark")
+	parser.add_argument("--output", help="File receiving the JSON results, stdout by default")
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as directory:
+		results = {
+			"python": sys.version.split()[0],
+			"cases": [
+				bench_case(directory, case, args.million_entries if case == "million" else args.entries, args.repeat)
+				for case in args.cases
+			],
+			"log": bench_log(directory, args.log_commands),
+		}
+
+	text = json.dumps(results, indent=2)
+	if args.output:
+		with open(args.output, "w") as file:
+			file.write(text + "\n")
+	else:
+		print(text)
+
+
+if __name__ == "__main__":
+	main()
@@ -1,92 +1,1085 @@
 import argparse
+import atexit
+import codecs
+import collections
+import concurrent.futures
 import datetime
+import fnmatch
 import json
 import os
+import queue
+import shlex
+import sys
 import tkinter as tk
 import tarfile
+import threading
+import time
 
-file_list = []
+session = None
 opened_recently = False
 
-def get_fl():
-	return globals()["file_list"]
 
-def execute_command(command: str, log_file: str):
+class VFSNode:
 	"""
-    Execute a command in the virtual shell.
+	A single entry of the virtual file system tree.
 
-    :param command: The command to execute
-    :type command: str
-    :param file_list: A list of files in the virtual file system
-    :type file_list: list[str]
-    :return: The output of the command
-    :rtype: str
-    """
+	Directories keep their children in a dict keyed by name, so lookups cost O(1)
+	and listings cost O(children). The sorted child list is cached and only rebuilt
+	after the directory changes.
+	"""
+	
+	__slots__ = ("name", "path", "parent", "is_dir", "member", "order", "offset", "size", "children", "_sorted")
+	
+	def __init__(self, name: str, path: str, parent, is_dir: bool, order: int):
+		self.name = name
+		self.path = path
+		self.parent = parent
+		self.is_dir = is_dir
+		self.member = None  # Name of the entry as stored in the archive, None for implicit dirs
+		self.order = order
+		self.offset = -1  # Offset of the member data in the (decompressed) archive
+		self.size = 0
+		self.children = {} if is_dir else None
+		self._sorted = None
+	
+	def sorted_children(self):
+		"""Return the children of the directory sorted by name (cached)."""
+		if self._sorted is None:
+			self._sorted = [self.children[name] for name in sorted(self.children)]
+		return self._sorted
+
+
+class VFSIndex:
+	"""
+	Directory index over the members of a tar archive.
+
+	The index is built once at load time and answers ``ls``/``cd``/``tree``
+	without rescanning the member list. Entries are also bucketed by base name
+	and by extension for ``find`` and globs. An index restored from a member index
+	cache starts with the top-level entries only; the subtree of a top-level
+	directory is read from the cache the first time it is accessed.
+	"""
+	
+	def __init__(self):
+		self.root = VFSNode("", "", None, True, -1)
+		self.root.parent = self.root
+		self.size = 0
+		self.archive = None
+		self.compression = None
+		self._pending = {}  # Top-level node -> callable adding its subtree
+		self._lock = threading.Lock()
+		self._by_name = {}
+		self._by_ext = {}
+	
+	@classmethod
+	def from_names(cls, names):
+		"""
+		Build an index from archive member names.
+
+		:param names: Member names in archive order
+		:type names: Iterable[str]
+		:return: The populated index
+		:rtype: VFSIndex
+		"""
+		index = cls()
+		for name in names:
+			index.add(name)
+		return index
 	
-	command = command.strip()
-	
-	file_list = globals()["file_list"]
-	
-	if command.startswith("ls"):
-		log(command, log_file)
-		return "\n".join(file_list)
-	elif command.startswith("cd"):
-		name = command[3:]
-		new_file_list = []
-		found = False
-		for file in file_list:
-			if file.startswith(name) and file != name:
-				found = True
-				new_file_list.append(file)
-		globals()["file_list"] = new_file_list
-		if found:
-			log(command + " SUCCEED", log_file)
-			return "Changed directory to " + name
+	@staticmethod
+	def split(path: str):
+		"""Split a path into its non-empty components, dropping ``.``."""
+		return [part for part in path.split("/") if part and part != "."]
+	
+	def add(self, member: str, is_dir: bool = False, offset: int = -1, size: int = 0, order: int = None):
+		"""
+		Insert an archive member, creating the intermediate directories.
+
+		:param member: Name of the member as stored in the archive
+		:type member: str
+		:param is_dir: Whether the member itself is a directory
+		:type is_dir: bool
+		:param offset: Offset of the member data in the archive
+		:type offset: int
+		:param size: Size of the member data
+		:type size: int
+		:param order: Position of the member in the archive, next free position by default
+		:type order: int
+		:return: The node of the member
+		:rtype: VFSNode
+		"""
+		parts = self.split(member)
+		if not parts:
+			return self.root
+		node = self.root
+		for i, part in enumerate(parts):
+			last = i == len(parts) - 1
+			child = node.children.get(part)
+			if child is None:
+				child = VFSNode(part, "/".join(parts[:i + 1]), node, is_dir or not last, self.size)
+				self.size += 1
+				self.attach(node, child)
+			elif not last and not child.is_dir:
+				# A file name is reused as a directory further down the archive
+				child.is_dir = True
+				child.children = {}
+			node = child
+		if is_dir and not node.is_dir:
+			node.is_dir = True
+			node.children = {}
+		node.member = member
+		node.offset = offset
+		node.size = size
+		if order is not None:
+			node.order = order
+		return node
+	
+	def attach(self, parent: VFSNode, child: VFSNode):
+		"""Add a new node to a directory and to the name and extension buckets."""
+		parent.children[child.name] = child
+		parent._sorted = None
+		self._by_name.setdefault(child.name, []).append(child)
+		self._by_ext.setdefault(os.path.splitext(child.name)[1], []).append(child)
+	
+	def load(self, node: VFSNode):
+		"""Make sure the subtree of a node has been read from the member index cache."""
+		if self._pending and node in self._pending:
+			with self._lock:
+				fill = self._pending.pop(node, None)
+				if fill is not None:
+					fill()
+	
+	def load_all(self):
+		"""Read every pending subtree from the member index cache."""
+		for node in list(self._pending):
+			self.load(node)
+	
+	def resolve(self, path: str, cwd: VFSNode = None):
+		"""
+		Resolve a path relative to a directory.
+
+		:param path: Absolute (``/a/b``) or relative (``a/../b``) path
+		:type path: str
+		:param cwd: Directory relative paths start from, the root by default
+		:type cwd: VFSNode
+		:return: The node the path points to or None
+		:rtype: VFSNode | None
+		"""
+		node = self.root if cwd is None or path.startswith("/") else cwd
+		for part in self.split(path):
+			if part == "..":
+				node = node.parent
+				continue
+			if not node.is_dir:
+				return None
+			self.load(node)
+			node = node.children.get(part)
+			if node is None:
+				return None
+		return node
+	
+	def listdir(self, node: VFSNode):
+		"""Return the names of the entries of a directory, sorted."""
+		if not node.is_dir:
+			return [node.name]
+		self.load(node)
+		return [child.name for child in node.sorted_children()]
+	
+	def tree(self, node: VFSNode, indent: str = "  "):
+		"""
+		Render a directory as an indented tree in one walk over its subtree.
+
+		:param node: The directory to render
+		:type node: VFSNode
+		:param indent: Indentation added per level
+		:type indent: str
+		:return: Lines of the tree
+		:rtype: list[str]
+		"""
+		lines = []
+		if not node.is_dir:
+			return [indent + node.name]
+		self.load(node)
+		stack = [(child, 1) for child in reversed(node.sorted_children())]
+		while stack:
+			child, depth = stack.pop()
+			if child.is_dir:
+				self.load(child)
+				lines.append(f"{indent * depth}{child.name}/")
+				stack.extend((grandchild, depth + 1) for grandchild in reversed(child.sorted_children()))
+			else:
+				lines.append(f"{indent * depth}{child.name}")
+		return lines
+	
+	def find(self, node: VFSNode, pattern: str = None):
+		"""
+		Find the entries below a directory whose name matches a shell pattern.
+
+		Literal names and ``*.ext`` patterns are answered from the name and
+		extension buckets; other patterns are matched against the distinct names only.
+
+		:param node: The directory to search
+		:type node: VFSNode
+		:param pattern: Pattern for the base name, every entry matches by default
+		:type pattern: str
+		:return: The matching entries sorted by path
+		:rtype: list[VFSNode]
+		"""
+		self.load_all()
+		if pattern is None:
+			candidates = [entry for entries in self._by_name.values() for entry in entries]
+		elif not has_magic(pattern):
+			candidates = self._by_name.get(pattern, [])
 		else:
-			log(command + " FAILED", log_file)
-			return "Directory not found"
-	elif command.startswith("exit"):
-		log(command, log_file)
-		exit()
-	elif command.startswith("echo"):
-		log(command, log_file)
-		return command[5:]  # Return text after "echo "
-	elif command.startswith("pwd"):
-		log(command, log_file)
-		return os.getcwd()  # Print working directory
-	elif command.startswith("tree"):
-		log(command, log_file)
-		path = command[5:]
-		res_string = ""
-		indent = "  "
-		
-		def tree(path, indent):
-			nonlocal res_string
-			path_prefix = path if path.endswith("/") else path + "/"
-			printed_dirs = set()
-			for file in sorted(globals()["file_list"]):
-				if file.startswith(path_prefix):
-					relative_path = file[len(path_prefix):]
-					if "/" in relative_path:
-						# This means it's a directory
-						first_dir = relative_path.split("/")[0]
-						if first_dir not in printed_dirs:
-							res_string += f"{indent}{first_dir}/"
-							printed_dirs.add(first_dir)
-							# Recursively call tree for the subdirectory
-							tree(os.path.join(path, first_dir), indent + "  ")
+			candidates = self._suffix_bucket(pattern)
+			if candidates is None:
+				names = fnmatch.filter(self._by_name, pattern)
+				candidates = [entry for name in names for entry in self._by_name[name]]
+		if node is not self.root:
+			prefix = node.path + "/"
+			candidates = [entry for entry in candidates if entry.path.startswith(prefix)]
+		return sorted(candidates, key=lambda entry: entry.path)
+	
+	def _suffix_bucket(self, pattern: str):
+		"""
+		Return the entries matching a ``*.ext`` pattern, None for any other pattern.
+
+		``os.path.splitext`` gives no extension to names such as ``.py`` or ``..py``,
+		so the names without extension ending with ``.ext`` are added to its bucket.
+
+		:param pattern: Pattern for the base name
+		:type pattern: str
+		:rtype: list[VFSNode] or None
+		"""
+		stem, ext = os.path.splitext(pattern)
+		if stem != "*" or not ext or has_magic(ext):
+			return None
+		return self._by_ext.get(ext, []) + [entry for entry in self._by_ext.get("", ()) if entry.name.endswith(ext)]
+	
+	def glob(self, pattern: str, cwd: VFSNode = None):
+		"""
+		Expand a path pattern such as ``src/*.py`` against the tree.
+
+		:param pattern: Absolute or relative path whose components may contain ``*``, ``?`` and ``[...]``
+		:type pattern: str
+		:param cwd: Directory relative patterns start from, the root by default
+		:type cwd: VFSNode
+		:return: ``(path as written, node)`` pairs sorted by path
+		:rtype: list[tuple[str, VFSNode]]
+		"""
+		absolute = pattern.startswith("/")
+		matches = [("/" if absolute else "", self.root if cwd is None or absolute else cwd)]
+		for part in self.split(pattern):
+			found = []
+			for shown, node in matches:
+				if not node.is_dir:
+					continue
+				self.load(node)
+				if part == "..":
+					found.append((shown + part + "/", node.parent))
+				elif not has_magic(part):
+					child = node.children.get(part)
+					if child is not None:
+						found.append((shown + part + "/", child))
+				else:
+					bucket = self._suffix_bucket(part)
+					if bucket is not None and len(bucket) < len(node.children):
+						children = sorted((child for child in bucket if child.parent is node), key=lambda child: child.name)
 					else:
-						# It's a file, print it
-						res_string += f"{indent}{relative_path}"
+						children = node.sorted_children()
+					found.extend(
+						(shown + child.name + "/", child) for child in children if fnmatch.fnmatchcase(child.name, part)
+					)
+			matches = found
+		return sorted((shown.rstrip("/") or "/", node) for shown, node in matches)
+	
+	def members(self, node: VFSNode):
+		"""
+		Return the archive names of every member below a directory in archive order.
+
+		:param node: The directory
+		:type node: VFSNode
+		:rtype: list[str]
+		"""
+		found = []
+		if node.is_dir:
+			self.load(node)
+		stack = list(node.children.values()) if node.is_dir else []
+		while stack:
+			child = stack.pop()
+			if child.is_dir:
+				# Filling a pending subtree also sets the member of its top-level directory
+				self.load(child)
+				stack.extend(child.children.values())
+			if child.member is not None:
+				found.append(child)
+		found.sort(key=lambda entry: entry.order)
+		return [entry.member for entry in found]
+
+
+def has_magic(pattern: str) -> bool:
+	"""Return whether a string contains shell wildcards."""
+	return "*" in pattern or "?" in pattern or "[" in pattern
+
+
+INDEX_CACHE_VERSION = 2
+
+
+def archive_compression(path: str):
+	"""
+	Detect the compression of an archive from its magic bytes.
+
+	:param path: Path to the archive
+	:type path: str
+	:return: ``"gz"``, ``"bz2"``, ``"xz"`` or None for a plain tar
+	:rtype: str | None
+	"""
+	with open(path, "rb") as file:
+		magic = file.read(6)
+	if magic.startswith(b"\x1f\x8b"):
+		return "gz"
+	if magic.startswith(b"BZh"):
+		return "bz2"
+	if magic.startswith(b"\xfd7zXZ\x00"):
+		return "xz"
+	return None
+
+
+def scan_members(path: str):
+	"""
+	Stream the member headers of an archive.
+
+	Compressed archives are decompressed on the fly and the member list kept by
+	``tarfile`` is dropped as we go, so memory does not grow with the archive.
+
+	:param path: Path to the archive
+	:type path: str
+	:return: ``(name, offset, size, type)`` tuples in archive order, type is ``"d"`` for directories
+	:rtype: Iterator[tuple[str, int, int, str]]
+	"""
+	with tarfile.open(path, "r|*") as tar:
+		for member in tar:
+			yield member.name, member.offset_data, member.size, "d" if member.isdir() else "f"
+			tar.members = []
+
+
+def index_cache_path(archive: str) -> str:
+	"""Return the path of the member index cache of an archive."""
+	return archive + ".idx"
+
+
+def write_index_cache(cache_path: str, stat: os.stat_result, compression, records, entries: int):
+	"""
+	Persist a member index grouped by top-level entry.
+
+	The first line is a JSON header with the archive mtime/size and the byte range
+	of every top-level group, followed by one ``[name, offset, size, type, order]``
+	line per member.
+
+	:param cache_path: Path of the cache file
+	:type cache_path: str
+	:param stat: Stat of the archive the index belongs to
+	:type stat: os.stat_result
+	:param compression: Compression of the archive
+	:type compression: str | None
+	:param records: ``(name, offset, size, type)`` tuples in archive order
+	:type records: list[tuple[str, int, int, str]]
+	:param entries: Number of entries of the index, implicit directories included
+	:type entries: int
+	"""
+	groups = {}
+	for order, (name, offset, size, kind) in enumerate(records):
+		parts = VFSIndex.split(name)
+		if not parts:
+			continue
+		group = groups.setdefault(parts[0], [kind == "d" or len(parts) > 1, []])
+		group[0] = group[0] or kind == "d" or len(parts) > 1
+		group[1].append(json.dumps([name, offset, size, kind, order]) + "\n")
+	ranges = {}
+	body = []
+	position = 0
+	for top, (is_dir, lines) in groups.items():
+		chunk = "".join(lines).encode()
+		ranges[top] = [position, len(chunk), is_dir]
+		body.append(chunk)
+		position += len(chunk)
+	header = {
+		"version": INDEX_CACHE_VERSION,
+		"mtime": stat.st_mtime_ns,
+		"size": stat.st_size,
+		"compression": compression,
+		"entries": entries,
+		"groups": ranges,
+	}
+	temp_path = cache_path + ".tmp"
+	with open(temp_path, "wb") as file:
+		file.write(json.dumps(header).encode() + b"\n")
+		for chunk in body:
+			file.write(chunk)
+	os.replace(temp_path, cache_path)
+
+
+def read_index_cache(cache_path: str, stat: os.stat_result):
+	"""
+	Restore a lazily filled index from a member index cache.
+
+	:param cache_path: Path of the cache file
+	:type cache_path: str
+	:param stat: Stat of the archive the cache must belong to
+	:type stat: os.stat_result
+	:return: An index holding the top-level entries or None if the cache is missing or stale
+	:rtype: VFSIndex | None
+	"""
+	try:
+		file = open(cache_path, "rb")
+	except OSError:
+		return None
+	with file:
+		try:
+			header = json.loads(file.readline())
+		except ValueError:
+			return None
+		if (header.get("version") != INDEX_CACHE_VERSION or header.get("mtime") != stat.st_mtime_ns
+				or header.get("size") != stat.st_size):
+			return None
+		body_start = file.tell()
 		
-		tree(path, "  ")
-		return res_string
-	else:
-		log(command + " NOT FOUND", log_file)
-		return "Command not found"
+		index = VFSIndex()
+		index.compression = header["compression"]
+		
+		def add_lines(data: bytes):
+			for line in data.splitlines():
+				name, offset, size, kind, order = json.loads(line)
+				index.add(name, kind == "d", offset, size, order)
+		
+		def reader(start: int, length: int):
+			def fill():
+				with open(cache_path, "rb") as group_file:
+					group_file.seek(body_start + start)
+					data = group_file.read(length)
+				# The entries of the group are already counted in the header
+				entries = index.size
+				add_lines(data)
+				index.size = entries
+			return fill
+		
+		for top, (start, length, is_dir) in header["groups"].items():
+			if is_dir:
+				node = VFSNode(top, top, index.root, True, -1)
+				index.attach(index.root, node)
+				index._pending[node] = reader(start, length)
+			else:
+				# Top-level files are a single line each, read them right away
+				file.seek(body_start + start)
+				add_lines(file.read(length))
+	index.size = header["entries"]
+	return index
+
+
+def load_vfs(archive: str, cache_path: str = None):
+	"""
+	Load the virtual file system from a tar archive.
+
+	A valid member index cache (same archive mtime and size) is used without
+	touching the archive; otherwise the headers are streamed once and the cache
+	is rewritten for the next start.
+
+	:param archive: Path to the tar archive, optionally gzip/bz2/xz compressed
+	:type archive: str
+	:param cache_path: Path of the member index cache, next to the archive by default
+	:type cache_path: str
+	:return: The directory index of the archive
+	:rtype: VFSIndex
+	"""
+	cache_path = cache_path or index_cache_path(archive)
+	stat = os.stat(archive)
+	index = read_index_cache(cache_path, stat)
+	if index is None:
+		compression = archive_compression(archive)
+		records = []
+		index = VFSIndex()
+		index.compression = compression
+		for name, offset, size, kind in scan_members(archive):
+			index.add(name, kind == "d", offset, size, len(records))
+			records.append((name, offset, size, kind))
+		try:
+			write_index_cache(cache_path, stat, compression, records, index.size)
+		except OSError:
+			pass  # A read-only location only costs the warm start
+	index.archive = archive
+	return index
+
+
+CHUNK_SIZE = 64 * 1024
+CONTENT_COMMANDS = ("cat", "head", "tail", "wc")
+
+
+def member_chunks(index: VFSIndex, node: VFSNode, chunk_size: int = CHUNK_SIZE):
+	"""
+	Read the data of an archive member in bounded chunks.
+
+	Plain tar archives are read straight from the data offset of the member;
+	compressed ones are streamed up to the member.
+
+	:param index: The index the node belongs to
+	:type index: VFSIndex
+	:param node: A file of the index
+	:type node: VFSNode
+	:param chunk_size: Maximal size of a chunk
+	:type chunk_size: int
+	:return: Chunks of the member data
+	:rtype: Iterator[bytes]
+	"""
+	if index.compression is None:
+		with open(index.archive, "rb") as file:
+			file.seek(node.offset)
+			remaining = node.size
+			while remaining > 0:
+				chunk = file.read(min(chunk_size, remaining))
+				if not chunk:
+					break
+				remaining -= len(chunk)
+				yield chunk
+		return
+	with tarfile.open(index.archive, "r|*") as tar:
+		for member in tar:
+			tar.members = []
+			if member.name == node.member:
+				data = tar.extractfile(member)
+				while True:
+					chunk = data.read(chunk_size)
+					if not chunk:
+						return
+					yield chunk
+
+
+def member_tail(index: VFSIndex, node: VFSNode, count: int, chunk_size: int = CHUNK_SIZE) -> bytes:
+	"""
+	Return the last lines of an archive member.
+
+	Plain tar archives are read backwards from the end of the member until enough
+	lines are found; compressed ones are streamed keeping only ``count`` lines.
+
+	:param index: The index the node belongs to
+	:type index: VFSIndex
+	:param node: A file of the index
+	:type node: VFSNode
+	:param count: Number of lines
+	:type count: int
+	:param chunk_size: Size of the blocks read from the end
+	:type chunk_size: int
+	:return: The last ``count`` lines
+	:rtype: bytes
+	"""
+	if count <= 0:
+		return b""
+	if index.compression is not None:
+		lines = collections.deque(maxlen=count)
+		rest = b""
+		for chunk in member_chunks(index, node, chunk_size):
+			parts = (rest + chunk).split(b"\n")
+			rest = parts.pop()
+			lines.extend(part + b"\n" for part in parts)
+		if rest:
+			lines.append(rest)
+		return b"".join(lines)
+	with open(index.archive, "rb") as file:
+		file.seek(node.offset + node.size - 1)
+		trailing = node.size > 0 and file.read(1) == b"\n"
+		# A trailing newline ends the last line instead of starting a new one
+		needed = count + 1 if trailing else count
+		position = node.offset + node.size
+		data = b""
+		while position > node.offset and data.count(b"\n") < needed:
+			step = min(chunk_size, position - node.offset)
+			position -= step
+			file.seek(position)
+			data = file.read(step) + data
+	lines = data.split(b"\n")
+	if trailing:
+		lines.pop()
+	return b"\n".join(lines[-count:]) + (b"\n" if trailing else b"")
+
+
+class ShellSession:
+	"""
+	State of one shell: the current directory and the log the commands go to.
+
+	The VFS index is only read, so any number of sessions can share one loaded
+	index; a session itself only holds a pointer to its current directory and
+	its own log sink, recorded under its own session number.
+	"""
+	
+	def __init__(self, index: VFSIndex, log_file: str):
+		"""
+		:param index: The loaded virtual file system
+		:type index: VFSIndex
+		:param log_file: Path to the log file of the session
+		:type log_file: str
+		"""
+		self.vfs = index
+		self.cwd = index.root
+		self.log_file = log_file
+		self.log = open_log(log_file)
+	
+	def close(self):
+		"""Flush the log of the session and stop tracking it in :func:`flush_logs`."""
+		self.log.close()
+	
+	def _log(self, command: str, log_file: str = None):
+		"""Record a command in the log of the session, or in another log given for this command."""
+		if log_file is None or log_file == self.log_file:
+			self.log.write(command)
+		else:
+			log(command, log_file)
+	
+	def files(self):
+		"""Return the archive names of the files below the current directory."""
+		return self.vfs.members(self.cwd)
+	
+	def execute(self, command: str, log_file: str = None):
+		"""
+		Execute a command in the virtual shell.
+
+		:param command: The command to execute
+		:type command: str
+		:param log_file: Log file of this command, the log of the session by default
+		:type log_file: str
+		:return: The output of the command
+		:rtype: str
+		"""
+		command = command.strip()
+		
+		if command.startswith("ls"):
+			self._log(command, log_file)
+			path = command[3:].strip()
+			if has_magic(path):
+				matches = self.vfs.glob(path, self.cwd)
+				if not matches:
+					return "No such file or directory"
+				return "\n".join(shown for shown, node in matches)
+			node = self.vfs.resolve(path, self.cwd)
+			if node is None:
+				return "No such file or directory"
+			return "\n".join(self.vfs.listdir(node))
+		elif command.startswith("cd"):
+			name = command[3:].strip()
+			node = self.vfs.resolve(name, self.cwd)
+			if node is not None and node.is_dir:
+				self.cwd = node
+				self._log(command + " SUCCEED", log_file)
+				return "Changed directory to " + name
+			else:
+				self._log(command + " FAILED", log_file)
+				return "Directory not found"
+		elif command.startswith("exit"):
+			self._log(command, log_file)
+			flush_logs()
+			exit()
+		elif command.startswith("echo"):
+			self._log(command, log_file)
+			return command[5:]  # Return text after "echo "
+		elif command.startswith("pwd"):
+			self._log(command, log_file)
+			return os.getcwd()  # Print working directory
+		elif command.split(" ", 1)[0] in CONTENT_COMMANDS:
+			return "".join(self._content(command, log_file))
+		elif command.startswith("find"):
+			return self._find(command, log_file)
+		elif command.startswith("tree"):
+			self._log(command, log_file)
+			node = self.vfs.resolve(command[5:].strip(), self.cwd)
+			if node is None:
+				return "No such file or directory"
+			return "\n".join(self.vfs.tree(node))
+		else:
+			self._log(command + " NOT FOUND", log_file)
+			return "Command not found"
+	
+	def stream(self, command: str, log_file: str = None):
+		"""
+		Execute a command, producing its output in chunks.
+
+		:param command: The command to execute
+		:type command: str
+		:param log_file: Log file of this command, the log of the session by default
+		:type log_file: str
+		:return: Chunks of the output of the command
+		:rtype: Iterator[str]
+		"""
+		command = command.strip()
+		if command.split(" ", 1)[0] in CONTENT_COMMANDS:
+			yield from self._content(command, log_file)
+		else:
+			yield self.execute(command, log_file)
+	
+	def _find(self, command: str, log_file: str = None):
+		"""Execute ``find [dir] [-name pattern]``."""
+		try:
+			args = shlex.split(command)[1:]
+		except ValueError:
+			args = command.split()[1:]
+		pattern = None
+		if "-name" in args:
+			position = args.index("-name")
+			if position + 1 >= len(args):
+				self._log(command + " FAILED", log_file)
+				return "find: missing argument to -name"
+			pattern = args[position + 1]
+			args = args[:position] + args[position + 2:]
+		start = args[0] if args else "."
+		node = self.vfs.resolve(start, self.cwd)
+		if node is None or not node.is_dir:
+			self._log(command + " FAILED", log_file)
+			return f"find: {start}: No such file or directory"
+		self._log(command, log_file)
+		offset = 0 if node is self.vfs.root else len(node.path) + 1
+		shown = start.rstrip("/") + "/"
+		return "\n".join(shown + entry.path[offset:] for entry in self.vfs.find(node, pattern))
+	
+	def _content(self, command: str, log_file: str = None):
+		"""
+		Execute ``cat``, ``head``, ``tail`` or ``wc`` over files of the archive.
+
+		The output is produced in chunks, so large members are never held in memory.
+		"""
+		try:
+			args = shlex.split(command)
+		except ValueError:
+			args = command.split()
+		name, args = args[0], args[1:]
+		count = 10
+		if name in ("head", "tail") and args and args[0] == "-n":
+			if len(args) < 2 or not args[1].isdigit():
+				self._log(command + " FAILED", log_file)
+				yield f"{name}: invalid number of lines"
+				return
+			count = int(args[1])
+			args = args[2:]
+		if not args:
+			self._log(command + " FAILED", log_file)
+			yield f"{name}: missing file operand"
+			return
+		
+		nodes = []
+		for path in args:
+			node = self.vfs.resolve(path, self.cwd)
+			if node is None:
+				self._log(command + " FAILED", log_file)
+				yield f"{name}: {path}: No such file or directory"
+				return
+			if node.is_dir or node.offset < 0:
+				self._log(command + " FAILED", log_file)
+				yield f"{name}: {path}: Is a directory"
+				return
+			nodes.append((path, node))
+		self._log(command, log_file)
+		
+		for path, node in nodes:
+			decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+			if name == "cat":
+				for chunk in member_chunks(self.vfs, node):
+					yield decoder.decode(chunk)
+			elif name == "head":
+				remaining = count
+				for chunk in member_chunks(self.vfs, node):
+					if remaining <= 0:
+						break
+					newlines = chunk.count(b"\n")
+					if newlines >= remaining:
+						cut = -1
+						for _ in range(remaining):
+							cut = chunk.index(b"\n", cut + 1)
+						chunk = chunk[:cut + 1]
+					remaining -= newlines
+					yield decoder.decode(chunk)
+			elif name == "tail":
+				yield decoder.decode(member_tail(self.vfs, node, count))
+			else:
+				lines = words = size = 0
+				in_word = False
+				for chunk in member_chunks(self.vfs, node):
+					lines += chunk.count(b"\n")
+					size += len(chunk)
+					words += len(chunk.split())
+					if in_word and not chunk[:1].isspace():
+						words -= 1  # The word continues from the previous chunk
+					in_word = not chunk[-1:].isspace()
+				yield f"{lines:>7} {words:>7} {size:>7} {path}\n"
+			yield decoder.decode(b"", final=True)
+
+
+def get_fl():
+	"""Return the archive names of the files below the current directory of the shell."""
+	return session.files()
+
+
+def execute_command(command: str, log_file: str):
+	"""
+	Execute a command in the shell session of the emulator.
+
+	:param command: The command to execute
+	:type command: str
+	:param log_file: Path to the log file
+	:type log_file: str
+	:return: The output of the command
+	:rtype: str
+	"""
+	return session.execute(command, log_file)
+
+
+def stream_command(command: str, log_file: str):
+	"""
+	Execute a command in the shell session of the emulator, producing its output in chunks.
+
+	:param command: The command to execute
+	:type command: str
+	:param log_file: Path to the log file
+	:type log_file: str
+	:return: Chunks of the output of the command
+	:rtype: Iterator[str]
+	"""
+	return session.stream(command, log_file)
+
+
+class JsonLinesLog:
+	"""
+	Append-only session log stored as JSON Lines.
+
+	Every command becomes one ``{"session": N, "command": ..., "time": ...}`` line.
+	Records are buffered and appended in batches, so the cost of a command does not
+	depend on how long the log already is. The session number follows the one of
+	the last line of the file, which is read from the end without parsing the
+	history, and the ones already given to other logs of the same file.
+	Writing and flushing are thread-safe: commands are logged by the worker thread
+	while the GUI thread flushes on exit.
+	"""
+	
+	def __init__(self, path: str, flush_every: int = 32, flush_interval: float = 1.0):
+		"""
+		:param path: Path to the ``.jsonl`` log file
+		:type path: str
+		:param flush_every: Number of buffered records that triggers a flush
+		:type flush_every: int
+		:param flush_interval: Seconds after which buffered records are flushed on the next write
+		:type flush_interval: float
+		"""
+		self.path = path
+		self.flush_every = flush_every
+		self.flush_interval = flush_interval
+		self.session = next_session(path)
+		self._buffer = []
+		self._last_flush = time.monotonic()
+		self._lock = threading.RLock()
+		_open_logs.add(self)
+	
+	def write(self, command: str):
+		"""Buffer one command of the current session."""
+		record = {"session": self.session, "command": command, "time": str(datetime.datetime.now())}
+		with self._lock:
+			self._buffer.append(json.dumps(record))
+			if len(self._buffer) >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval:
+				self.flush()
+	
+	def flush(self):
+		"""Append the buffered records to the file."""
+		with self._lock:
+			if self._buffer:
+				with open(self.path, "a") as file:
+					file.write("\n".join(self._buffer) + "\n")
+				self._buffer.clear()
+			self._last_flush = time.monotonic()
+	
+	def close(self):
+		"""Flush the buffered records and stop tracking the log in :func:`flush_logs`."""
+		self.flush()
+		_open_logs.discard(self)
+
+
+class JsonLog:
+	"""
+	Session log in the legacy nested ``{"session_N": [...]}`` JSON format.
+
+	The whole file is rewritten on every command. The session number is taken
+	when the first command is written, after the sessions already in the file.
+	"""
+	
+	def __init__(self, path: str):
+		"""
+		:param path: Path to the ``.json`` log file
+		:type path: str
+		"""
+		self.path = path
+		self.session = None
+	
+	def write(self, command: str):
+		"""Append one command of the current session to the file."""
+		with open(self.path, "r") as file:
+			try:
+				current = json.load(file)
+			except json.decoder.JSONDecodeError:
+				current = {}
+		if self.session is None:
+			self.session = max((int(name[name.find("_") + 1:]) for name in current), default=0) + 1
+		current.setdefault(f"session_{self.session}", []).append(
+			{"command": command, "time": str(datetime.datetime.now())}
+		)
+		with open(self.path, "w") as file:
+			json.dump(current, file)
+	
+	def flush(self):
+		"""Nothing is buffered."""
+	
+	def close(self):
+		"""Nothing is buffered."""
+
+
+def open_log(log_file: str):
+	"""
+	Open a log sink of its own for a session.
+
+	:param log_file: Path to the log file, ``.jsonl`` for a JSON Lines log
+	:type log_file: str
+	:return: A log with ``write``, ``flush`` and ``close`` methods
+	:rtype: JsonLinesLog | JsonLog
+	"""
+	if log_file.endswith(".jsonl"):
+		return JsonLinesLog(log_file)
+	return JsonLog(log_file)
+
+
+_log_writers = {}  # Writers of the module-level log() by path
+_open_logs = set()  # Every JSON Lines log not closed yet, flushed by flush_logs()
+_sessions = {}  # Last session number given out per log path
+_sessions_lock = threading.Lock()
+
+
+def next_session(path: str) -> int:
+	"""
+	Give out the session number of a new JSON Lines log.
+
+	:param path: Path to the ``.jsonl`` log file
+	:type path: str
+	:return: A number above the last session of the file and above every number already given out
+	:rtype: int
+	"""
+	with _sessions_lock:
+		number = max(_sessions.get(path, 0), last_logged_session(path)) + 1
+		_sessions[path] = number
+	return number
+
+
+def last_logged_session(path: str) -> int:
+	"""
+	Return the session number of the last record of a JSON Lines log.
+
+	Only the tail of the file is read.
+
+	:param path: Path to the ``.jsonl`` log file
+	:type path: str
+	:return: The last session number, 0 for a missing or empty log
+	:rtype: int
+	"""
+	try:
+		file = open(path, "rb")
+	except FileNotFoundError:
+		return 0
+	with file:
+		end = file.seek(0, os.SEEK_END)
+		chunk = b""
+		position = end
+		while position > 0:
+			step = min(4096, position)
+			position -= step
+			file.seek(position)
+			chunk = file.read(step) + chunk
+			lines = chunk.strip().split(b"\n")
+			if len(lines) > 1 or position == 0:
+				for line in reversed(lines):
+					if line.strip():
+						return json.loads(line)["session"]
+				return 0
+	return 0
+
+
+def read_log_sessions(path: str) -> dict:
+	"""
+	Rebuild the ``session_N`` grouping of the legacy log from a JSON Lines log.
+
+	:param path: Path to the ``.jsonl`` log file
+	:type path: str
+	:return: Records grouped by session, e.g. ``{"session_1": [{"command": ..., "time": ...}]}``
+	:rtype: dict
+	"""
+	sessions = {}
+	with open(path, "r") as file:
+		for line in file:
+			if not line.strip():
+				continue
+			record = json.loads(line)
+			sessions.setdefault(f"session_{record['session']}", []).append(
+				{"command": record["command"], "time": record["time"]}
+			)
+	return sessions
+
+
+def migrate_log(json_path: str, jsonl_path: str):
+	"""
+	Convert a legacy nested JSON log into a JSON Lines log.
+
+	:param json_path: Path to the legacy ``{"session_N": [...]}`` log
+	:type json_path: str
+	:param jsonl_path: Path of the JSON Lines log to create
+	:type jsonl_path: str
+	"""
+	with open(json_path, "r") as file:
+		try:
+			current = json.load(file)
+		except json.decoder.JSONDecodeError:
+			current = {}
+	with open(jsonl_path, "w") as file:
+		for session, records in current.items():
+			number = int(session[session.find("_") + 1:])
+			for record in records:
+				file.write(json.dumps({"session": number, "command": record["command"], "time": record["time"]}) + "\n")
+
+
+def flush_logs():
+	"""Flush every buffered JSON Lines log."""
+	for writer in list(_open_logs):
+		writer.flush()
+
+
+atexit.register(flush_logs)
 
 
 def log(command: str, log_file: str):
+	"""
+	Record a command in the session log.
+
+	``.jsonl`` logs go through a buffered :class:`JsonLinesLog`, any other path
+	uses the legacy nested JSON format.
+
+	:param command: The command to record
+	:type command: str
+	:param log_file: Path to the log file
+	:type log_file: str
+	"""
+	if log_file.endswith(".jsonl"):
+		get_log_writer(log_file).write(command)
+	else:
+		log_json(command, log_file)
+
+
+def get_log_writer(log_file: str) -> JsonLinesLog:
+	"""Return the buffered writer of a JSON Lines log, creating it on first use."""
+	writer = _log_writers.get(log_file)
+	if writer is None:
+		writer = _log_writers[log_file] = JsonLinesLog(log_file)
+	return writer
+
+
+def log_json(command: str, log_file: str):
 	with open(log_file, "r") as file:
 		try:
 			current = json.load(file)
@@ -105,18 +1098,171 @@ def log(command: str, log_file: str):
 		json.dump(current, file)
 
 
-def create_gui(start_script: str, log_file: str):
+POLL_INTERVAL_MS = 30
+RENDER_BUDGET = 64 * 1024
+MAX_SCROLLBACK_LINES = 5000
+OUTPUT_QUEUE_CHUNKS = 16  # Chunks the worker may run ahead of the GUI
+PUT_TIMEOUT = 0.1  # Seconds between cancellation checks of a worker waiting for the GUI
+
+
+class CommandWorker:
+	"""
+	Runs shell commands on a background thread and hands their output back in chunks.
+
+	Commands run one at a time in submission order, so ``cd`` takes effect before
+	the next command starts. The GUI thread collects the output with :meth:`drain`.
+	The output queue is bounded: a command producing output faster than the GUI
+	renders it waits, so a large member is never held in memory as a whole.
+	"""
+	
+	def __init__(self, shell: ShellSession):
+		self.shell = shell
+		self.output = queue.Queue(OUTPUT_QUEUE_CHUNKS)
+		self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+		self._submitted = 0
+		self._cancelled = 0
+		self._pending = collections.deque()
+	
+	def submit(self, command: str):
+		"""Queue a command for execution."""
+		self._submitted += 1
+		self.executor.submit(self._run, command, self._submitted)
+	
+	def cancel(self):
+		"""Stop the running command, drop the queued ones and the output not rendered yet."""
+		self._cancelled = self._submitted
+		self._pending.clear()
+		while True:
+			try:
+				self.output.get_nowait()
+			except queue.Empty:
+				break
+	
+	def shutdown(self):
+		"""Cancel everything and stop the worker thread."""
+		self.cancel()
+		self.executor.shutdown(wait=False, cancel_futures=True)
+	
+	def _put(self, job: int, kind: str, text: str = None) -> bool:
+		"""
+		Queue output of a job, waiting while the GUI has not caught up.
+
+		:return: False if the job was cancelled before the output could be queued
+		:rtype: bool
+		"""
+		while job > self._cancelled:
+			try:
+				self.output.put((job, kind, text), timeout=PUT_TIMEOUT)
+				return True
+			except queue.Full:
+				pass
+		return False
+	
+	def _run(self, command: str, job: int):
+		if not self._put(job, "text", f"$ {command}\n"):
+			return
+		chunk = ""
+		chunks = self.shell.stream(command)
+		try:
+			for chunk in chunks:
+				if job <= self._cancelled or chunk and not self._put(job, "text", chunk):
+					chunks.close()
+					try:
+						# cancel() emptied the queue, so there is room for the marker
+						self.output.put_nowait((job, "cancelled", "^C\n"))
+					except queue.Full:
+						pass
+					return
+		except SystemExit:
+			self._put(job, "exit")
+			return
+		except Exception as error:
+			chunk = f"Error: {error}"
+			self._put(job, "text", chunk)
+		if not chunk.endswith("\n"):
+			self._put(job, "text", "\n")
+	
+	def drain(self, budget: int = RENDER_BUDGET):
+		"""
+		Collect the output produced since the last call.
+
+		:param budget: Maximal number of characters returned, the rest is kept for the next call
+		:type budget: int
+		:return: The collected text and whether the ``exit`` command was executed
+		:rtype: tuple[str, bool]
+		"""
+		while True:
+			try:
+				job, kind, text = self.output.get_nowait()
+			except queue.Empty:
+				break
+			if kind == "text" and job <= self._cancelled:
+				continue  # Queued by a cancelled command just before it stopped
+			self._pending.append((kind, text))
+		parts = []
+		size = 0
+		while self._pending and size < budget:
+			kind, text = self._pending.popleft()
+			if kind == "exit":
+				return "".join(parts), True
+			if size + len(text) > budget:
+				self._pending.appendleft((kind, text[budget - size:]))
+				text = text[:budget - size]
+			parts.append(text)
+			size += len(text)
+		return "".join(parts), False
+
+
+def run_headless(shell: ShellSession, script, out=None):
+	"""
+	Run commands without the GUI, writing the transcript to a stream.
+
+	Log records of a JSON Lines log are only written once, after the last command.
+
+	:param shell: The session running the commands
+	:type shell: ShellSession
+	:param script: Lines with one command each, e.g. an open start script or stdin
+	:type script: Iterable[str]
+	:param out: Stream receiving the output, stdout by default
+	:type out: TextIO
+	:return: Number of executed commands
+	:rtype: int
+	"""
+	out = out or sys.stdout
+	if isinstance(shell.log, JsonLinesLog):
+		shell.log.flush_every = float("inf")
+		shell.log.flush_interval = float("inf")
+	count = 0
+	try:
+		for line in script:
+			command = line.strip()
+			if not command:
+				continue
+			count += 1
+			out.write(f"$ {command}\n")
+			chunk = ""
+			for chunk in shell.stream(command):
+				out.write(chunk)
+			if not chunk.endswith("\n"):
+				out.write("\n")
+	except SystemExit:
+		pass
+	finally:
+		shell.log.flush()
+		flush_logs()
+	return count
+
+
+def create_gui(start_script: str, shell: ShellSession):
 	"""
     Creates the main GUI window for the OS Shell Emulator.
 
-    :param file_list: A list of files in the virtual file system
-    :type file_list: list[str]
     :param start_script: Path to the start script
     :type start_script: str
+    :param shell: The session running the commands
+    :type shell: ShellSession
     """
 	
-	file_list = globals()["file_list"]
-	
 	root = tk.Tk()
 	root.title("OS Shell Emulator")
 	
@@ -128,29 +1274,51 @@ def create_gui(start_script: str, log_file: str):
 	output_area = tk.Text(root, height=20, width=80)
 	output_area.pack(pady=10)
 	
+	worker = CommandWorker(shell)
+	
+	# Move the output of the worker into the output area, a bounded amount per tick
+	def render():
+		text, finished = worker.drain()
+		if text:
+			output_area.insert(tk.END, text)
+			lines = int(output_area.index("end-1c").split(".")[0])
+			if lines > MAX_SCROLLBACK_LINES:
+				output_area.delete("1.0", f"{lines - MAX_SCROLLBACK_LINES + 1}.0")
+			output_area.see(tk.END)
+		if finished:
+			close()
+		else:
+			root.after(POLL_INTERVAL_MS, render)
+	
+	def close():
+		worker.shutdown()
+		flush_logs()
+		root.destroy()
+	
 	# Function to handle command submission
 	def submit_command():
 		command = command_entry.get()
-		output = execute_command(command, log_file)
-		output_area.insert(tk.END, f"$ {command}\n{output}\n")
+		worker.submit(command)
 		command_entry.delete(0, tk.END)
 	
 	# Submit button
 	submit_button = tk.Button(root, text="Execute", command=submit_command)
 	submit_button.pack()
+	cancel_button = tk.Button(root, text="Cancel", command=worker.cancel)
+	cancel_button.pack()
 	root.bind("<Return>", lambda event: submit_command())
+	root.bind("<Control-c>", lambda event: worker.cancel())
+	root.protocol("WM_DELETE_WINDOW", close)
 	
 	# Load start script commands
 	try:
 		with open(start_script, "r") as script_file:
 			for line in script_file:
-				start_command = line.strip()
-				start_output = execute_command(start_command, log_file)
-				output_area.insert(tk.END, f"$ {start_command}\n{start_output}\n")
-				command_entry.delete(0, tk.END)
+				worker.submit(line.strip())
 	except FileNotFoundError:
 		output_area.insert(tk.END, "Start script not found.\n")
 	
+	root.after(POLL_INTERVAL_MS, render)
 	root.mainloop()
 
 
@@ -171,17 +1339,38 @@ def main():
 	parser.add_argument(
 		"--start_script", required=False, help="Path to the start script", default=configs["start"]
 	)
+	parser.add_argument(
+		"--migrate_log", required=False, help="Legacy JSON log to convert into the JSON Lines log file"
+	)
+	parser.add_argument(
+		"--headless", action="store_true", help="Run the start script (or stdin for '-') without the GUI"
+	)
 	args = parser.parse_args()
-
-	log("SESSION STARTED", args.log_file)
 	
+	# One-shot migration of a legacy log next to the configured JSON Lines log
+	legacy_log = args.migrate_log or os.path.splitext(args.log_file)[0] + ".json"
+	if args.log_file.endswith(".jsonl") and not os.path.exists(args.log_file) and os.path.exists(legacy_log):
+		migrate_log(legacy_log, args.log_file)
+
 	# Load virtual file system
-	with tarfile.TarFile(args.vfs, "r") as tar_ref:
-		globals()["file_list"] = tar_ref.getnames()
+	globals()["session"] = ShellSession(load_vfs(args.vfs), args.log_file)
+	session.log.write("SESSION STARTED")
 	
 	if __name__ == "__main__":
-		# Create GUI
-		create_gui(args.start_script, args.log_file)
+		if args.headless:
+			if args.start_script == "-":
+				run_headless(session, sys.stdin)
+			else:
+				try:
+					script_file = open(args.start_script, "r")
+				except FileNotFoundError:
+					print("Start script not found.")
+				else:
+					with script_file:
+						run_headless(session, script_file)
+		else:
+			# Create GUI
+			create_gui(args.start_script, session)
 
 
 if __name__ == "__main__":
@@ -1,8 +1,14 @@
+import io
 import json
+import os
 import tarfile
+import tempfile
+import threading
+import time
 import unittest
 
-from main import execute_command, main, get_fl
+import main as shell
+from main import execute_command, main, get_fl, VFSIndex, JsonLinesLog, read_log_sessions, migrate_log, load_vfs, CommandWorker, run_headless, ShellSession
 
 class TestGui(unittest.TestCase):
     def setUp(self):
@@ -32,5 +38,270 @@ class TestGui(unittest.TestCase):
         assert self.main_files == new_files
 
 
+class TestVFSIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = VFSIndex.from_names(["b", "a/x.txt", "a/c/y.txt", "./a/c/z.txt"])
+
+    def test_listdir(self):
+        assert self.index.listdir(self.index.root) == ["a", "b"]
+        assert self.index.listdir(self.index.resolve("a")) == ["c", "x.txt"]
+
+    def test_resolve(self):
+        c = self.index.resolve("a/c")
+        assert c.is_dir
+        assert self.index.resolve("../x.txt", c).path == "a/x.txt"
+        assert self.index.resolve("/b", c).path == "b"
+        assert self.index.resolve("a/missing") is None
+
+    def test_tree(self):
+        assert self.index.tree(self.index.root) == ["  a/", "    c/", "      y.txt", "      z.txt", "    x.txt", "  b"]
+
+    def test_members(self):
+        assert self.index.members(self.index.resolve("a")) == ["a/x.txt", "a/c/y.txt", "./a/c/z.txt"]
+
+
+def make_archive(path, files, mode="w"):
+    with tarfile.open(path, mode) as tar:
+        for name, data in files:
+            info = tarfile.TarInfo(name)
+            if data is None:
+                info.type = tarfile.DIRTYPE
+                tar.addfile(info)
+            else:
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+
+
+class TestLoadVFS(unittest.TestCase):
+    files = [("a", None), ("a/x.txt", b"x"), ("a/c/y.txt", b"yy"), ("b.txt", b"b")]
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def check(self, index):
+        assert index.listdir(index.root) == ["a", "b.txt"]
+        assert index.tree(index.resolve("a")) == ["  c/", "    y.txt", "  x.txt"]
+        assert index.members(index.root) == ["a", "a/x.txt", "a/c/y.txt", "b.txt"]
+        assert index.resolve("a/c/y.txt").size == 2
+
+    def test_cache(self):
+        archive = os.path.join(self.dir.name, "vfs.tar")
+        make_archive(archive, self.files)
+        cold = load_vfs(archive)
+        assert os.path.exists(archive + ".idx")
+        self.check(cold)
+        warm = load_vfs(archive)
+        assert warm._pending
+        self.check(warm)
+        assert warm.resolve("a/c/y.txt").offset == cold.resolve("a/c/y.txt").offset
+        assert warm.size == cold.size == 5
+        warm.load_all()
+        assert warm.size == 5
+
+    def test_cache_order(self):
+        # The directory member comes after a file that already created it
+        archive = os.path.join(self.dir.name, "vfs.tar")
+        make_archive(archive, [("a/x.txt", b"x"), ("a", None), ("b", b"b")])
+        cold = load_vfs(archive)
+        warm = load_vfs(archive)
+        assert cold.members(cold.root) == warm.members(warm.root) == ["a/x.txt", "a", "b"]
+        assert warm.size == cold.size == 3
+
+    def test_compressed(self):
+        archive = os.path.join(self.dir.name, "vfs.tar.xz")
+        make_archive(archive, self.files, "w:xz")
+        index = load_vfs(archive)
+        assert index.compression == "xz"
+        self.check(index)
+
+
+class TestContentCommands(unittest.TestCase):
+    data = b"".join(b"line %d word\n" % i for i in range(1, 20001))
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.log = os.path.join(self.dir.name, "log.jsonl")
+
+    def tearDown(self):
+        shell.flush_logs()
+        self.dir.cleanup()
+
+    def load(self, name, mode):
+        archive = os.path.join(self.dir.name, name)
+        make_archive(archive, [("d", None), ("d/f.txt", self.data), ("g.txt", b"one two\nend")], mode)
+        shell.session = ShellSession(load_vfs(archive), self.log)
+
+    def check(self):
+        assert execute_command("cat d/f.txt", self.log) == self.data.decode()
+        assert execute_command("head -n 2 d/f.txt", self.log) == "line 1 word\nline 2 word\n"
+        assert execute_command("tail -n 1 d/f.txt", self.log) == "line 20000 word\n"
+        assert execute_command("tail -n 1 g.txt", self.log) == "end"
+        assert execute_command("wc d/f.txt", self.log).split() == ["20000", "60000", str(len(self.data)), "d/f.txt"]
+        assert execute_command("cat d", self.log) == "cat: d: Is a directory"
+
+    def test_plain(self):
+        self.load("vfs.tar", "w")
+        self.check()
+
+    def test_compressed(self):
+        self.load("vfs.tar.gz", "w:gz")
+        self.check()
+
+
+class TestCommandWorker(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.worker = CommandWorker(ShellSession(VFSIndex.from_names([]), os.path.join(self.dir.name, "log.jsonl")))
+
+    def tearDown(self):
+        self.worker.shutdown()
+        shell.flush_logs()
+        self.dir.cleanup()
+
+    def wait(self):
+        self.worker.executor.submit(lambda: None).result()
+
+    def test_output(self):
+        self.worker.submit("echo hello")
+        self.worker.submit("exit")
+        self.wait()
+        assert self.worker.drain() == ("$ echo hello\nhello\n$ exit\n", True)
+
+    def test_budget(self):
+        self.worker.submit("echo " + "x" * 100)
+        self.wait()
+        first, _ = self.worker.drain(budget=50)
+        rest, _ = self.worker.drain(budget=1000)
+        assert len(first) == 50
+        assert first + rest == "$ echo " + "x" * 100 + "\n" + "x" * 100 + "\n"
+
+    def test_cancel(self):
+        gate = threading.Event()
+        self.worker.executor.submit(gate.wait)
+        self.worker.submit("echo dropped")
+        self.worker.cancel()
+        gate.set()
+        self.wait()
+        assert self.worker.drain() == ("", False)
+
+    def test_cancel_large_cat(self):
+        archive = os.path.join(self.dir.name, "vfs.tar")
+        make_archive(archive, [("big.txt", b"x" * (shell.CHUNK_SIZE * 4 * shell.OUTPUT_QUEUE_CHUNKS))])
+        self.worker.shell = ShellSession(load_vfs(archive), self.worker.shell.log_file)
+        self.worker.submit("cat big.txt")
+        while not self.worker.output.full():
+            time.sleep(0.01)
+        # The worker waits for the GUI instead of reading the whole member
+        assert self.worker.output.qsize() == shell.OUTPUT_QUEUE_CHUNKS
+        self.worker.cancel()
+        self.wait()
+        assert self.worker.drain() == ("^C\n", False)
+        assert self.worker.output.empty()
+
+
+class TestShellSession(unittest.TestCase):
+    def test_shared_index(self):
+        with tempfile.TemporaryDirectory() as directory:
+            log_file = os.path.join(directory, "log.jsonl")
+            index = VFSIndex.from_names(["a/x.txt", "b/y.txt"])
+            first = ShellSession(index, log_file)
+            second = ShellSession(index, log_file)
+            first.execute("cd a")
+            assert first.execute("ls") == "x.txt"
+            assert second.execute("ls") == "a\nb"
+            assert first.files() == ["a/x.txt"]
+            assert second.vfs is first.vfs
+            shell.flush_logs()
+
+    def test_own_log(self):
+        with tempfile.TemporaryDirectory() as directory:
+            log_file = os.path.join(directory, "log.jsonl")
+            index = VFSIndex.from_names([])
+            first = ShellSession(index, log_file)
+            second = ShellSession(index, log_file)
+            first.execute("echo 1")
+            second.execute("echo 2")
+            run_headless(first, ["echo 3\n"], io.StringIO())
+            assert second.log.flush_every != float("inf")
+            first.close()
+            second.close()
+            sessions = read_log_sessions(log_file)
+            assert [record["command"] for record in sessions["session_1"]] == ["echo 1", "echo 3"]
+            assert [record["command"] for record in sessions["session_2"]] == ["echo 2"]
+
+
+class TestSearch(unittest.TestCase):
+    def setUp(self):
+        index = VFSIndex.from_names(["src/a.py", "src/b.py", "src/c.txt", "src/sub/d.py", "docs/a.py", "docs/.py"])
+        self.dir = tempfile.TemporaryDirectory()
+        self.session = ShellSession(index, os.path.join(self.dir.name, "log.jsonl"))
+
+    def tearDown(self):
+        shell.flush_logs()
+        self.dir.cleanup()
+
+    def test_glob(self):
+        assert self.session.execute("ls src/*.py") == "src/a.py\nsrc/b.py"
+        assert self.session.execute("ls */a.py") == "docs/a.py\nsrc/a.py"
+        assert self.session.execute("ls docs/*.py") == "docs/.py\ndocs/a.py"
+        assert self.session.execute("ls src/*.md") == "No such file or directory"
+        assert self.session.execute("ls src/*") == "src/a.py\nsrc/b.py\nsrc/c.txt\nsrc/sub"
+
+    def test_find(self):
+        assert self.session.execute("find . -name a.py") == "./docs/a.py\n./src/a.py"
+        assert self.session.execute("find docs -name '*.py'") == "docs/.py\ndocs/a.py"
+        assert self.session.execute("find src -name '*.py'") == "src/a.py\nsrc/b.py\nsrc/sub/d.py"
+        assert self.session.execute("find / -name '?.txt'") == "/src/c.txt"
+        assert self.session.execute("find src -name '*'") == "src/a.py\nsrc/b.py\nsrc/c.txt\nsrc/sub\nsrc/sub/d.py"
+        self.session.execute("cd src/sub")
+        assert self.session.execute("find .. -name 'd*'") == "../sub/d.py"
+
+
+class TestHeadless(unittest.TestCase):
+    def test_run_headless(self):
+        with tempfile.TemporaryDirectory() as directory:
+            log_file = os.path.join(directory, "log.jsonl")
+            out = io.StringIO()
+            shell_session = ShellSession(VFSIndex.from_names([]), log_file)
+            count = run_headless(shell_session, ["echo a\n", "\n", "echo b\n", "exit\n", "echo c\n"], out)
+            assert count == 3
+            assert out.getvalue() == "$ echo a\na\n$ echo b\nb\n$ exit\n"
+            sessions = read_log_sessions(log_file)
+            assert [record["command"] for record in sessions["session_1"]] == ["echo a", "echo b", "exit"]
+
+
+class TestJsonLinesLog(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "log.jsonl")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_sessions(self):
+        first = JsonLinesLog(self.path, flush_every=100, flush_interval=60)
+        first.write("ls")
+        assert not os.path.exists(self.path)
+        first.flush()
+        second = JsonLinesLog(self.path)
+        second.write("cd 1")
+        second.flush()
+        sessions = read_log_sessions(self.path)
+        assert [record["command"] for record in sessions["session_1"]] == ["ls"]
+        assert [record["command"] for record in sessions["session_2"]] == ["cd 1"]
+
+    def test_migrate(self):
+        legacy = {"session_1": [{"command": "ls", "time": "t1"}], "session_2": [{"command": "pwd", "time": "t2"}]}
+        legacy_path = os.path.join(self.dir.name, "log.json")
+        with open(legacy_path, "w") as file:
+            json.dump(legacy, file)
+        migrate_log(legacy_path, self.path)
+        assert read_log_sessions(self.path) == legacy
+        assert JsonLinesLog(self.path).session == 3
+
+
 if __name__ == '__main__':
     unittest.main()
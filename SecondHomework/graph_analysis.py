@@ -0,0 +1,340 @@
+from collections import Counter, deque
+from typing import Dict, List, Optional, Tuple
+
+from visualize_dependency import DependencyGraph
+
+
+def successors(graph: DependencyGraph) -> List[List[int]]:
+    """
+    Build the adjacency lists of a graph, without duplicate edges.
+
+    Args:
+        graph (DependencyGraph): The dependency graph.
+
+    Returns:
+        List[List[int]]: For every node id, the ids of its dependencies in insertion order.
+    """
+    adjacency = [[] for _ in graph.names]
+    seen = set()
+    for source, target in zip(graph.sources, graph.targets):
+        if (source, target) not in seen:
+            seen.add((source, target))
+            adjacency[source].append(target)
+    return adjacency
+
+
+def predecessors(graph: DependencyGraph) -> List[List[int]]:
+    """
+    Build the reverse adjacency lists of a graph, without duplicate edges.
+
+    Args:
+        graph (DependencyGraph): The dependency graph.
+
+    Returns:
+        List[List[int]]: For every node id, the ids of the packages depending on it.
+    """
+    reverse = [[] for _ in graph.names]
+    for source, targets in enumerate(successors(graph)):
+        for target in targets:
+            reverse[target].append(source)
+    return reverse
+
+
+def strongly_connected_components(graph: DependencyGraph) -> List[List[int]]:
+    """
+    Find the strongly connected components with Tarjan's algorithm.
+
+    The traversal is iterative, so deep graphs do not hit the recursion limit.
+
+    Args:
+        graph (DependencyGraph): The dependency graph.
+
+    Returns:
+        List[List[int]]: The components as lists of node ids, in reverse topological
+            order (a component only depends on components listed before it).
+    """
+    adjacency = successors(graph)
+    count = len(adjacency)
+    index = [-1] * count
+    low = [0] * count
+    on_stack = [False] * count
+    stack = []
+    components = []
+    counter = 0
+
+    for start in range(count):
+        if index[start] != -1:
+            continue
+        work = [(start, 0)]
+        while work:
+            node, position = work.pop()
+            if position == 0:
+                index[node] = low[node] = counter
+                counter += 1
+                stack.append(node)
+                on_stack[node] = True
+            recurse = False
+            targets = adjacency[node]
+            while position < len(targets):
+                target = targets[position]
+                position += 1
+                if index[target] == -1:
+                    work.append((node, position))
+                    work.append((target, 0))
+                    recurse = True
+                    break
+                if on_stack[target]:
+                    low[node] = min(low[node], index[target])
+            if recurse:
+                continue
+            if low[node] == index[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    component.append(member)
+                    if member == node:
+                        break
+                components.append(component)
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[node])
+    return components
+
+
+def component_ids(graph: DependencyGraph, components: List[List[int]]) -> List[int]:
+    """Map every node id to the index of its strongly connected component."""
+    owner = [0] * len(graph.names)
+    for component_id, component in enumerate(components):
+        for node in component:
+            owner[node] = component_id
+    return owner
+
+
+def cycles(graph: DependencyGraph) -> List[List[str]]:
+    """
+    List the dependency cycles of a graph.
+
+    Args:
+        graph (DependencyGraph): The dependency graph.
+
+    Returns:
+        List[List[str]]: Package names of every component with more than one package
+            or with a package depending on itself.
+    """
+    adjacency = successors(graph)
+    found = []
+    for component in strongly_connected_components(graph):
+        if len(component) > 1 or component[0] in adjacency[component[0]]:
+            found.append(sorted(graph.names[node] for node in component))
+    return found
+
+
+def transitive_reduction(graph: DependencyGraph) -> DependencyGraph:
+    """
+    Drop every edge that is implied by a longer path.
+
+    Reachability is computed once per strongly connected component as an
+    integer bitset, walking the components from the leaves up. Edges inside a
+    cycle are kept; between two components only the first edge is kept.
+
+    Args:
+        graph (DependencyGraph): The dependency graph.
+
+    Returns:
+        DependencyGraph: A graph with the same reachability, the same node ids and
+            no duplicate edges.
+    """
+    components = strongly_connected_components(graph)
+    owner = component_ids(graph, components)
+    adjacency = successors(graph)
+
+    # Edges between components, keeping the first original edge of each pair
+    condensed: List[Dict[int, Tuple[int, int]]] = [{} for _ in components]
+    for source, targets in enumerate(adjacency):
+        for target in targets:
+            if owner[source] != owner[target]:
+                condensed[owner[source]].setdefault(owner[target], (source, target))
+
+    reach = [0] * len(components)
+    kept = set()
+    for component_id in range(len(components)):
+        covered = 0
+        # Successors closest in topological order first: they have the largest ids
+        for target_id in sorted(condensed[component_id], reverse=True):
+            if not covered >> target_id & 1:
+                kept.add(condensed[component_id][target_id])
+            covered |= reach[target_id] | (1 << target_id)
+        reach[component_id] = covered
+
+    reduced = DependencyGraph()
+    for name in graph.names:
+        reduced.node(name)
+    seen = set()
+    for source, target in zip(graph.sources, graph.targets):
+        if (source, target) in seen:
+            continue
+        seen.add((source, target))
+        if owner[source] == owner[target] or (source, target) in kept:
+            reduced.sources.append(source)
+            reduced.targets.append(target)
+    return reduced
+
+
+def reverse_dependencies(graph: DependencyGraph) -> Dict[str, List[str]]:
+    """
+    Index the packages that directly pull in each package.
+
+    Args:
+        graph (DependencyGraph): The dependency graph.
+
+    Returns:
+        Dict[str, List[str]]: Sorted direct dependents of every package.
+    """
+    reverse = predecessors(graph)
+    return {name: sorted(graph.names[node] for node in reverse[node_id]) for node_id, name in enumerate(graph.names)}
+
+
+def dependents(graph: DependencyGraph, package_name: str) -> List[str]:
+    """
+    Find every package that pulls in a package, directly or transitively.
+
+    Args:
+        graph (DependencyGraph): The dependency graph.
+        package_name (str): The package to look up.
+
+    Returns:
+        List[str]: Sorted names of the dependents, empty for an unknown package.
+    """
+    start = graph.ids.get(package_name)
+    if start is None:
+        return []
+    reverse = predecessors(graph)
+    seen = {start}
+    queue = deque([start])
+    while queue:
+        for parent in reverse[queue.popleft()]:
+            if parent not in seen:
+                seen.add(parent)
+                queue.append(parent)
+    seen.discard(start)
+    return sorted(graph.names[node] for node in seen)
+
+
+def longest_chains(graph: DependencyGraph, limit: int = 5) -> List[List[str]]:
+    """
+    Find the longest dependency chains.
+
+    Chains are measured on the graph of strongly connected components, so a cycle
+    counts as one step; each step is named after one package of its component.
+
+    Args:
+        graph (DependencyGraph): The dependency graph.
+        limit (int): The maximum number of chains returned.
+
+    Returns:
+        List[List[str]]: The longest chains, longest first, starting from different packages.
+    """
+    components = strongly_connected_components(graph)
+    owner = component_ids(graph, components)
+    condensed = [set() for _ in components]
+    for source, targets in enumerate(successors(graph)):
+        for target in targets:
+            if owner[source] != owner[target]:
+                condensed[owner[source]].add(owner[target])
+
+    length = [1] * len(components)
+    following: List[Optional[int]] = [None] * len(components)
+    for component_id, targets in enumerate(condensed):
+        for target_id in targets:
+            if length[target_id] + 1 > length[component_id] or (
+                length[target_id] + 1 == length[component_id] and target_id < following[component_id]
+            ):
+                length[component_id] = length[target_id] + 1
+                following[component_id] = target_id
+
+    starts = sorted(range(len(components)), key=lambda component_id: (-length[component_id], component_id))
+    chains = []
+    for component_id in starts[:limit]:
+        chain = []
+        while component_id is not None:
+            chain.append(graph.names[min(components[component_id])])
+            component_id = following[component_id]
+        chains.append(chain)
+    return chains
+
+
+def fan_rankings(graph: DependencyGraph, limit: int = 10) -> Dict[str, List[Tuple[str, int]]]:
+    """
+    Rank packages by the number of direct dependents (fan-in) and dependencies (fan-out).
+
+    Args:
+        graph (DependencyGraph): The dependency graph.
+        limit (int): The length of each ranking.
+
+    Returns:
+        Dict[str, List[Tuple[str, int]]]: ``fan_in`` and ``fan_out`` rankings of ``(name, count)``.
+    """
+    adjacency = successors(graph)
+    fan_in = Counter(target for targets in adjacency for target in targets)
+
+    def ranking(counts) -> List[Tuple[str, int]]:
+        ranked = sorted(((graph.names[node], count) for node, count in counts if count), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit]
+
+    return {
+        "fan_in": ranking(fan_in.items()),
+        "fan_out": ranking((node, len(targets)) for node, targets in enumerate(adjacency)),
+    }
+
+
+def depth_distribution(graph: DependencyGraph, root: str) -> Dict[int, int]:
+    """
+    Count the packages at each shortest distance from the root package.
+
+    Args:
+        graph (DependencyGraph): The dependency graph.
+        root (str): The root package, at depth 0.
+
+    Returns:
+        Dict[int, int]: Number of packages per depth.
+    """
+    start = graph.ids.get(root)
+    if start is None:
+        return {}
+    adjacency = successors(graph)
+    depth = {start: 0}
+    queue = deque([start])
+    while queue:
+        node = queue.popleft()
+        for target in adjacency[node]:
+            if target not in depth:
+                depth[target] = depth[node] + 1
+                queue.append(target)
+    return dict(sorted(Counter(depth.values()).items()))
+
+
+def analyze(graph: DependencyGraph, root: Optional[str] = None, limit: int = 10) -> Dict[str, object]:
+    """
+    Summarize a dependency graph.
+
+    Args:
+        graph (DependencyGraph): The dependency graph.
+        root (Optional[str]): The root package for the depth distribution.
+        limit (int): The length of the rankings and of the chain list.
+
+    Returns:
+        Dict[str, object]: Package and edge counts, cycles, the number of edges removed by
+            the transitive reduction, the longest chains, fan-in/fan-out rankings and the
+            depth distribution.
+    """
+    edges = sum(len(targets) for targets in successors(graph))
+    return {
+        "packages": len(graph.names),
+        "edges": edges,
+        "cycles": cycles(graph),
+        "redundant_edges": edges - len(transitive_reduction(graph)),
+        "longest_chains": longest_chains(graph, limit),
+        **fan_rankings(graph, limit),
+        "depth_distribution": depth_distribution(graph, root) if root is not None else {},
+    }
@@ -0,0 +1,61 @@
+import unittest
+
+from graph_analysis import *
+from visualize_dependency import DependencyGraph
+
+
+def make_graph(edges):
+	graph = DependencyGraph()
+	for source, target in edges:
+		graph.add_edge(source, target)
+	return graph
+
+
+class TestGraphAnalysis(unittest.TestCase):
+	def setUp(self):
+		self.graph = make_graph([
+			("root", "a"), ("root", "b"), ("a", "b"), ("b", "c"), ("c", "a"),
+			("a", "d"), ("root", "d"), ("d", "e"), ("root", "e"),
+		])
+	
+	def test_strongly_connected_components(self):
+		components = [sorted(self.graph.names[node] for node in component)
+					  for component in strongly_connected_components(self.graph)]
+		self.assertEqual(components, [["e"], ["d"], ["a", "b", "c"], ["root"]])
+		self.assertEqual(cycles(self.graph), [["a", "b", "c"]])
+		self.assertEqual(cycles(make_graph([("x", "x")])), [["x"]])
+	
+	def test_transitive_reduction(self):
+		reduced = transitive_reduction(self.graph)
+		self.assertEqual(reduced.edge_strings(), [
+			"root --> a", "a --> b", "b --> c", "c --> a", "a --> d", "d --> e",
+		])
+	
+	def test_reverse_dependencies(self):
+		self.assertEqual(reverse_dependencies(self.graph)["d"], ["a", "root"])
+		self.assertEqual(dependents(self.graph, "d"), ["a", "b", "c", "root"])
+		self.assertEqual(dependents(self.graph, "missing"), [])
+	
+	def test_longest_chains(self):
+		self.assertEqual(longest_chains(self.graph, 2), [["root", "a", "d", "e"], ["a", "d", "e"]])
+	
+	def test_fan_rankings(self):
+		rankings = fan_rankings(self.graph, 2)
+		self.assertEqual(rankings["fan_out"], [("root", 4), ("a", 2)])
+		self.assertEqual(rankings["fan_in"], [("a", 2), ("b", 2)])
+	
+	def test_analyze(self):
+		report = analyze(self.graph, "root")
+		self.assertEqual(report["packages"], 6)
+		self.assertEqual(report["edges"], 9)
+		self.assertEqual(report["redundant_edges"], 3)
+		self.assertEqual(report["depth_distribution"], {0: 1, 1: 4, 2: 1})
+	
+	def test_deep_chain(self):
+		graph = make_graph([(f"p{i}", f"p{i + 1}") for i in range(5000)])
+		self.assertEqual(len(strongly_connected_components(graph)), 5001)
+		self.assertEqual(len(longest_chains(graph, 1)[0]), 5001)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -1,4 +1,10 @@
+import io
+import os
+import sys
+import tarfile
+import tempfile
 import unittest
+import zipfile
 from unittest.mock import mock_open, patch
 
 from visualize_dependency import *
@@ -18,6 +24,43 @@ class TestParseXmlConfig(unittest.TestCase):
 		result = parse_xml_config(config_path)
 		self.assertEqual(result, expected_config)
 
+	
+	@patch("builtins.open", new_callable=mock_open,
+		   read_data='<config><visualizer_path>mmdc</visualizer_path><packages><package>requests</package><package>flask</package></packages><max_depth>2</max_depth><repository_url>https://pypi.org/simple/</repository_url><render_processes>2</render_processes></config>')
+	def test_parse_xml_config_packages(self, mock_file):
+		result = parse_xml_config("fake_config.xml")
+		self.assertIsNone(result["package_name"])
+		self.assertEqual(result["packages"], ["requests", "flask"])
+		self.assertEqual(result["render_processes"], 2)
+
+
+class TestRootPackages(unittest.TestCase):
+	def test_root_packages(self):
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join(directory, "requirements.txt")
+			with open(path, "w") as file:
+				file.write("-r base.txt\n# comment\nrequests>=2.0  # pinned\nFlask[async]==3.0\nnumpy; extra == 'x'\n\nclick\n")
+			config = {"package_name": "requests", "packages": ["rich"], "requirements_file": path}
+			self.assertEqual(root_packages(config), ["requests", "rich", "Flask", "click"])
+	
+	def test_shared_resolution(self):
+		calls = []
+		dependencies = {"a": ["urllib3", "idna"], "b": ["urllib3"], "urllib3": ["idna"]}
+		
+		def resolver(package_name: str):
+			calls.append(package_name)
+			return dependencies.get(package_name, [])
+		
+		shared = MemoizedResolver(resolver)
+		graphs = [resolve_dependency_graph(root, 3, 2, shared) for root in ("a", "b")]
+		self.assertEqual(sorted(calls), ["a", "b", "idna", "urllib3"])
+		self.assertEqual((shared.hits, shared.misses), (2, 4))
+		union = merge_graphs(graphs)
+		self.assertEqual(
+			union.edge_strings(),
+			["a --> urllib3", "a --> idna", "urllib3 --> idna", "b --> urllib3"]
+		)
+
 
 class TestGetDependencies(unittest.TestCase):
 	@patch("subprocess.run")
@@ -42,6 +85,131 @@ class TestGetDependencies(unittest.TestCase):
 		self.assertEqual(result, [])
 
 
+class FakeDistribution:
+	def __init__(self, name, requires):
+		self.metadata = {"Name": name}
+		self.requires = requires
+
+
+class TestMetadataIndex(unittest.TestCase):
+	def test_get_dependencies(self):
+		index = MetadataIndex([
+			FakeDistribution("My_Package", [
+				"zope.interface>=5",
+				"Requests[socks] (>=2.0)",
+				"pytest ; extra == 'test'",
+				"colorama ; python_version < '3'",
+				"requests>=3 ; python_version >= '3'",
+			]),
+			FakeDistribution("my-package", ["shadowed"]),
+			FakeDistribution("leaf", None),
+		])
+		self.assertEqual(index.get_dependencies("my.package"), ["Requests", "zope.interface"])
+		self.assertEqual(index("LEAF"), [])
+		self.assertEqual(index("missing"), [])
+	
+	def test_normalize_name(self):
+		self.assertEqual(normalize_name("Zope__Interface.Foo"), "zope-interface-foo")
+
+
+class TestLocalRepositoryIndex(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+		root = self.directory.name
+		self.write_wheel(os.path.join(root, "app-1.0-py3-none-any.whl"), "app", ["old"])
+		os.mkdir(os.path.join(root, "app"))
+		self.write_wheel(os.path.join(root, "app", "app-1.10-py3-none-any.whl"), "app", [
+			"lib_a>=1", "lib-b ; extra == 'dev'",
+		])
+		with tarfile.open(os.path.join(root, "lib_a-2.0.tar.gz"), "w:gz") as sdist:
+			self.add(sdist, "lib_a-2.0/PKG-INFO", "Metadata-Version: 1.0\nName: lib_a\n")
+			self.add(sdist, "lib_a-2.0/lib_a.egg-info/requires.txt", "lib-c\n\n[dev]\nlib-d\n")
+	
+	def tearDown(self):
+		self.directory.cleanup()
+	
+	@staticmethod
+	def write_wheel(path, name, requirements):
+		metadata = "Metadata-Version: 2.1\nName: " + name + "\n"
+		metadata += "".join(f"Requires-Dist: {requirement}\n" for requirement in requirements)
+		with zipfile.ZipFile(path, "w") as wheel:
+			wheel.writestr(f"{name}/__init__.py", "")
+			wheel.writestr(f"{name}-1.dist-info/METADATA", metadata)
+	
+	@staticmethod
+	def add(archive, name, text):
+		data = text.encode()
+		info = tarfile.TarInfo(name)
+		info.size = len(data)
+		archive.addfile(info, io.BytesIO(data))
+	
+	def test_get_dependencies(self):
+		index = LocalRepositoryIndex(self.directory.name)
+		self.assertEqual(index.versions["app"], "1.10")
+		self.assertEqual(index("app"), ["lib_a"])
+		self.assertEqual(index("Lib-A"), ["lib-c"])
+		self.assertEqual(index("missing"), [])
+		result = build_dependency_graph("app", 3, resolver=index)
+		self.assertEqual(result, ["app --> lib_a", "lib_a --> lib-c"])
+	
+	def test_create_resolver(self):
+		index = create_resolver({"repository_url": "file://" + self.directory.name})
+		self.assertIsInstance(index, LocalRepositoryIndex)
+		self.assertEqual(index._requirements, {"app": ["lib_a"], "lib-a": ["lib-c"]})
+	
+	def test_local_repository_path(self):
+		self.assertEqual(local_repository_path(self.directory.name), self.directory.name)
+		self.assertEqual(local_repository_path("file://" + self.directory.name), self.directory.name)
+		self.assertIsNone(local_repository_path("https://pypi.org/simple/"))
+
+
+class TestDependencyCache(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+		self.path = os.path.join(self.directory.name, "cache.sqlite")
+		self.calls = []
+	
+	def tearDown(self):
+		self.directory.cleanup()
+	
+	def resolver(self, package_name: str):
+		self.calls.append(package_name)
+		return ["dep1", "dep2"]
+	
+	def test_persistent(self):
+		cache = DependencyCache(self.resolver, self.path, fingerprint="env", versions={"pkg": "1.0"})
+		self.assertEqual(cache("pkg"), ["dep1", "dep2"])
+		self.assertEqual(cache("PKG"), ["dep1", "dep2"])
+		cache.close()
+		cache = DependencyCache(self.resolver, self.path, fingerprint="env", versions={"pkg": "1.0"})
+		self.assertEqual(cache("pkg"), ["dep1", "dep2"])
+		cache.close()
+		self.assertEqual(self.calls, ["pkg"])
+		self.assertEqual((cache.hits, cache.misses), (1, 0))
+	
+	def test_invalidation(self):
+		cache = DependencyCache(self.resolver, self.path, fingerprint="env", versions={"pkg": "1.0"})
+		cache("pkg")
+		cache.close()
+		cache = DependencyCache(self.resolver, self.path, fingerprint="env", versions={"pkg": "2.0"})
+		cache("pkg")
+		cache.close()
+		cache = DependencyCache(self.resolver, self.path, fingerprint="changed", versions={"pkg": "2.0"})
+		cache("pkg")
+		cache.close()
+		self.assertEqual(self.calls, ["pkg", "pkg", "pkg"])
+	
+	def test_default_fingerprint(self):
+		# The database is created in a directory on sys.path, like the script directory
+		with patch.object(sys, "path", [self.directory.name] + sys.path):
+			for _ in range(2):
+				cache = DependencyCache(self.resolver, self.path)
+				cache("pkg")
+				cache.close()
+		self.assertEqual(self.calls, ["pkg"])
+		self.assertEqual((cache.hits, cache.misses), (1, 0))
+
+
 class TestBuildDependencyGraph(unittest.TestCase):
 	@patch("subprocess.run")
 	def test_build_dependency_graph(self, mock_run):
@@ -59,6 +227,178 @@ class TestBuildDependencyGraph(unittest.TestCase):
 			"example_pkg --> dep2"
 		]
 		self.assertEqual(result, expected_graph)
+	
+	def test_build_dependency_graph_breadth_first(self):
+		dependencies = {
+			"root": ["a", "b"],
+			"a": ["c", "b"],
+			"b": ["c"],
+			"c": ["d"],
+			"d": ["e"],
+		}
+		
+		def mock_get_dependencies(package_name: str):
+			return dependencies.get(package_name, [])
+		
+		with patch("visualize_dependency.get_dependencies", mock_get_dependencies):
+			result = build_dependency_graph("root", 3, concurrency=4)
+		expected_graph = [
+			"root --> a",
+			"root --> b",
+			"a --> c",
+			"a --> b",
+			"b --> c",
+			"c --> d",
+		]
+		self.assertEqual(result, expected_graph)
+
+
+class TestIncrementalRebuild(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+		self.state_path = os.path.join(self.directory.name, "state.json")
+		self.calls = []
+	
+	def tearDown(self):
+		self.directory.cleanup()
+	
+	def resolver(self, package_name: str):
+		self.calls.append(package_name)
+		return {"root": ["a", "b"], "a": ["c"]}.get(package_name, [])
+	
+	def test_incremental_resolver(self):
+		previous = {"root": ["a"], "a": [], "b": ["x"]}
+		resolver = IncrementalResolver(self.resolver, previous, changed_packages({"a": "1.0", "b": "1.0"}, {"a": "2.0", "b": "1.0"}))
+		graph = resolve_dependency_graph("root", 3, 2, resolver)
+		self.assertEqual(graph.edge_strings(), ["root --> a", "a --> c"])
+		self.assertEqual(sorted(self.calls), ["a", "c"])
+		self.assertEqual((resolver.reused, resolver.resolved), (1, 2))
+		self.assertEqual(resolver.dependencies, {"root": ["a"], "a": ["c"], "c": []})
+	
+	def test_changed_packages(self):
+		self.assertEqual(changed_packages({"a": "1", "b": "1", "c": "1"}, {"a": "1", "b": "2", "d": "1"}), ["b", "c", "d"])
+	
+	@staticmethod
+	def render(visualizer_path, script_path, output_path=IMAGE_PATH):
+		open(output_path, "w").close()
+		return True
+	
+	@patch("visualize_dependency.installed_versions", return_value={"a": "1.0"})
+	@patch("visualize_dependency.visualize_graph", side_effect=render)
+	def test_main_skips_unchanged_output(self, mock_visualize, mock_versions):
+		config = {
+			"package_name": "root",
+			"max_depth": 3,
+			"visualizer_path": "mmdc",
+			"state_path": self.state_path,
+		}
+		cwd = os.getcwd()
+		os.chdir(self.directory.name)
+		try:
+			with patch("visualize_dependency.parse_xml_config", return_value=config), \
+				patch("visualize_dependency.create_resolver", return_value=self.resolver):
+				main("config.xml")
+				main("config.xml")
+				mock_versions.return_value = {"a": "2.0"}
+				main("config.xml")
+			with open(OUTPUT_PATHS["mermaid"]) as file:
+				script = file.read()
+		finally:
+			os.chdir(cwd)
+		self.assertEqual(script, "graph TD\n    root --> a\n    root --> b\n    a --> c\n")
+		self.assertEqual(mock_visualize.call_count, 1)
+		self.assertEqual(self.calls, ["root", "a", "b", "c", "a"])
+		self.assertEqual(load_graph_state(self.state_path)["versions"], {"a": "2.0"})
+	
+	@patch("visualize_dependency.installed_versions", return_value={"a": "1.0"})
+	@patch("visualize_dependency.visualize_graph", return_value=False)
+	def test_main_renders_after_failure(self, mock_visualize, mock_versions):
+		config = {
+			"package_name": "root",
+			"max_depth": 3,
+			"visualizer_path": "mmdc",
+			"state_path": self.state_path,
+		}
+		cwd = os.getcwd()
+		os.chdir(self.directory.name)
+		try:
+			with patch("visualize_dependency.parse_xml_config", return_value=config), \
+				patch("visualize_dependency.create_resolver", return_value=self.resolver):
+				main("config.xml")
+				self.assertIsNone(load_graph_state(self.state_path)["hashes"]["mermaid"])
+				mock_visualize.side_effect = self.render
+				main("config.xml")
+				main("config.xml")
+				self.assertEqual(mock_visualize.call_count, 2)
+				os.remove(IMAGE_PATH)
+				main("config.xml")
+				self.assertEqual(mock_visualize.call_count, 3)
+		finally:
+			os.chdir(cwd)
+
+
+class TestProfiler(unittest.TestCase):
+	@patch("subprocess.run")
+	def test_profile_report(self, mock_run):
+		mock_run.return_value.returncode = 0
+		mock_run.return_value.stdout = "Name: pkg\nRequires: dep1, dep2"
+		config = {"package_name": "root", "max_depth": 1, "visualizer_path": "mmdc"}
+		with tempfile.TemporaryDirectory() as directory:
+			cwd = os.getcwd()
+			os.chdir(directory)
+			try:
+				with patch("visualize_dependency.parse_xml_config", return_value=config), \
+					patch("visualize_dependency.create_resolver", return_value=get_dependencies):
+					main("config.xml", "profile.json")
+				with open("profile.json") as file:
+					report = json.load(file)
+			finally:
+				os.chdir(cwd)
+		self.assertEqual(list(report["latencies_s"]), ["root"])
+		self.assertEqual(report["subprocess_calls"], 2)
+		self.assertEqual(report["renders"], 1)
+		self.assertEqual(report["depth_distribution"], {"root": {"0": 1, "1": 2}})
+		self.assertIn("Slowest packages:", Profiler.summary(report))
+		self.assertIsNone(sys.modules["visualize_dependency"].profiler)
+	
+	def test_cache_counters(self):
+		shared = MemoizedResolver(lambda package_name: [])
+		shared("a")
+		shared("A")
+		profiler = Profiler()
+		self.assertEqual(Profiler.cache_counters(profiler.wrap(shared)), {"MemoizedResolver": {"hits": 1, "misses": 1}})
+
+
+class TestDependencyGraph(unittest.TestCase):
+	def setUp(self):
+		self.graph = DependencyGraph()
+		self.graph.add_edge("pkg1", "pkg2")
+		self.graph.add_edge("pkg1", 'we"ird')
+		self.graph.add_edge("pkg2", "pkg1")
+	
+	def test_interning(self):
+		self.assertEqual(self.graph.names, ["pkg1", "pkg2", 'we"ird'])
+		self.assertEqual(list(self.graph.sources), [0, 0, 1])
+		self.assertEqual(list(self.graph.targets), [1, 2, 0])
+		self.assertEqual(len(self.graph), 3)
+	
+	def test_write_graph(self):
+		outputs = {}
+		for fmt in ("mermaid", "plantuml", "dot"):
+			file = io.StringIO()
+			write_graph(self.graph, file, fmt)
+			outputs[fmt] = file.getvalue()
+		self.assertEqual(outputs["mermaid"], generate_mermaid_script(self.graph.edge_strings()))
+		self.assertEqual(
+			outputs["plantuml"],
+			'@startuml\n[pkg1] --> [pkg2]\n[pkg1] --> [we"ird]\n[pkg2] --> [pkg1]\n@enduml\n'
+		)
+		self.assertEqual(
+			outputs["dot"],
+			'digraph dependencies {\n    "pkg1" -> "pkg2";\n    "pkg1" -> "we\\"ird";\n    "pkg2" -> "pkg1";\n}\n'
+		)
+		with self.assertRaises(ValueError):
+			write_graph(self.graph, io.StringIO(), "svg")
 
 
 class TestGenerateMermaidScript(unittest.TestCase):
@@ -104,6 +444,23 @@ class TestVisualizeGraph(unittest.TestCase):
 			f"{visualizer_path} -i {script_path} -o mermaid_graph.png", capture_output=True, shell=True
 		)
 
+	
+	def test_render_graphs(self):
+		with tempfile.TemporaryDirectory() as directory:
+			fake = os.path.join(directory, "fake_mmdc.py")
+			with open(fake, "w") as file:
+				file.write("import sys\nopen(sys.argv[4], 'w').write(open(sys.argv[2]).read())\n")
+			jobs = []
+			for label in ("a", "b", "union"):
+				script_path = os.path.join(directory, f"{label}.mmd")
+				with open(script_path, "w") as file:
+					file.write(label)
+				jobs.append((script_path, os.path.join(directory, f"{label}.png")))
+			render_graphs(f'"{sys.executable}" "{fake}"', jobs, processes=2)
+			for label in ("a", "b", "union"):
+				with open(os.path.join(directory, f"{label}.png")) as file:
+					self.assertEqual(file.read(), label)
+
 
 if __name__ == '__main__':
 	unittest.main()
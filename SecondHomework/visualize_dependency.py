@@ -1,6 +1,45 @@
+import argparse
+import hashlib
+import importlib.metadata
+import json
+import os
+import re
+import sqlite3
 import subprocess
+import tarfile
+import threading
+import time
+import urllib.parse
+import urllib.request
 import xml.etree.ElementTree as ET
-from typing import Dict, List
+import zipfile
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from email.parser import HeaderParser
+from itertools import repeat
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+try:
+    from packaging.markers import InvalidMarker, Marker
+    from packaging.version import InvalidVersion, Version
+except ImportError:  # packaging is optional, markers and versions are then approximated
+    Marker = None
+    Version = None
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_CACHE_PATH = "dependency_cache.sqlite"
+REQUIREMENT_NAME = re.compile(r"\s*([A-Za-z0-9](?:[A-Za-z0-9._-]*[A-Za-z0-9])?)")
+SDIST_SUFFIXES = (".tar.gz", ".tgz", ".tar.bz2", ".tar.xz", ".zip")
+DEFAULT_PROFILE_PATH = "profile_report.json"
+OUTPUT_PATHS = {
+    "mermaid": "mermaid_script.mmd",
+    "plantuml": "dependency_graph.puml",
+    "dot": "dependency_graph.dot",
+}
+IMAGE_PATH = "mermaid_graph.png"
+
+# Profiler of the running main() call, None when profiling is off
+profiler = None
 
 
 def parse_xml_config(config_path: str) -> Dict[str, str]:
@@ -12,16 +51,39 @@ def parse_xml_config(config_path: str) -> Dict[str, str]:
 
     Returns:
         Dict[str, str]: A dictionary containing visualizer path, package name, max depth, and repository URL.
+            The optional ``concurrency``, ``backend``, ``cache_path``, ``formats`` (comma-separated),
+            ``analysis_path``, ``reduce``, ``state_path``, ``packages`` (``<package>`` list),
+            ``requirements_file`` and ``render_processes`` elements are included when present.
     """
     tree = ET.parse(config_path)
     root = tree.getroot()
 
     config = {
         "visualizer_path": root.find("visualizer_path").text,
-        "package_name": root.find("package_name").text,
+        "package_name": root.findtext("package_name"),
         "max_depth": int(root.find("max_depth").text),
         "repository_url": root.find("repository_url").text,
     }
+    if root.find("concurrency") is not None:
+        config["concurrency"] = int(root.find("concurrency").text)
+    if root.find("backend") is not None:
+        config["backend"] = root.find("backend").text.strip()
+    if root.find("cache_path") is not None:
+        config["cache_path"] = (root.find("cache_path").text or "").strip()
+    if root.find("formats") is not None:
+        config["formats"] = [fmt.strip() for fmt in root.find("formats").text.split(",") if fmt.strip()]
+    if root.find("analysis_path") is not None:
+        config["analysis_path"] = root.find("analysis_path").text.strip()
+    if root.find("reduce") is not None:
+        config["reduce"] = root.find("reduce").text.strip().lower() == "true"
+    if root.find("state_path") is not None:
+        config["state_path"] = root.find("state_path").text.strip()
+    if root.find("packages") is not None:
+        config["packages"] = [package.text.strip() for package in root.find("packages").findall("package")]
+    if root.find("requirements_file") is not None:
+        config["requirements_file"] = root.find("requirements_file").text.strip()
+    if root.find("render_processes") is not None:
+        config["render_processes"] = int(root.find("render_processes").text)
     return config
 
 
@@ -35,6 +97,8 @@ def get_dependencies(package_name: str) -> List[str]:
     Returns:
         List[str]: A list of dependencies for the given package.
     """
+    if profiler is not None:
+        profiler.count_subprocess()
     try:
         result = subprocess.run(
             ["pip", "show", package_name], capture_output=True, text=True, check=True
@@ -53,32 +117,577 @@ def get_dependencies(package_name: str) -> List[str]:
     return dependencies
 
 
-def build_dependency_graph(package_name: str, max_depth: int) -> List[str]:
+def normalize_name(name: str) -> str:
+    """
+    Normalize a project name as described in PEP 503.
+
+    Args:
+        name (str): The project name.
+
+    Returns:
+        str: The lowercase name with runs of ``-``, ``_`` and ``.`` replaced by ``-``.
+    """
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def parse_requirement(requirement: str) -> Optional[Tuple[str, str]]:
+    """
+    Split a ``Requires-Dist`` value into the project name and the environment marker.
+
+    Args:
+        requirement (str): A requirement such as ``idna (<4,>=2.5) ; extra == "socks"``.
+
+    Returns:
+        Optional[Tuple[str, str]]: The project name and the marker (empty if there is none),
+            or None if the requirement has no valid name.
+    """
+    requirement, _, marker = requirement.partition(";")
+    match = REQUIREMENT_NAME.match(requirement)
+    if match is None:
+        return None
+    return match.group(1), marker.strip()
+
+
+def marker_applies(marker: str) -> bool:
+    """
+    Evaluate an environment marker for the running interpreter without extras.
+
+    Without ``packaging`` only extras are taken into account: a marker mentioning
+    ``extra`` is false, any other marker is true.
+
+    Args:
+        marker (str): The marker, empty for an unconditional requirement.
+
+    Returns:
+        bool: Whether the requirement applies.
+    """
+    if not marker:
+        return True
+    if Marker is None:
+        return "extra" not in marker
+    try:
+        return Marker(marker).evaluate({"extra": ""})
+    except InvalidMarker:
+        return False
+
+
+def applicable_requirements(requirements: Iterable[str]) -> List[str]:
+    """
+    Reduce ``Requires-Dist`` values to the names of the projects that apply here.
+
+    Args:
+        requirements (Iterable[str]): The raw requirements of a distribution.
+
+    Returns:
+        List[str]: Unique project names sorted case-insensitively, as ``pip show`` lists them.
+    """
+    dependencies = {}
+    for requirement in requirements:
+        parsed = parse_requirement(requirement)
+        if parsed is not None and marker_applies(parsed[1]):
+            dependencies.setdefault(normalize_name(parsed[0]), parsed[0])
+    return sorted(dependencies.values(), key=str.lower)
+
+
+class MetadataIndex:
+    """
+    Dependencies of every installed distribution, read in-process with importlib.metadata.
+
+    The metadata is read once when the index is created; looking a package up
+    afterwards is a dictionary access. Names are compared after PEP 503 normalization.
+    Requirements that only apply to extras or to other environments are skipped,
+    like ``pip show`` does.
+    """
+
+    def __init__(self, distributions: Optional[Iterable[importlib.metadata.Distribution]] = None):
+        """
+        Args:
+            distributions (Optional[Iterable[Distribution]]): The distributions to index,
+                all distributions found on ``sys.path`` by default.
+        """
+        self.requirements: Dict[str, List[str]] = {}
+        if distributions is None:
+            distributions = importlib.metadata.distributions()
+        for dist in distributions:
+            name = dist.metadata["Name"]
+            if not name or normalize_name(name) in self.requirements:
+                continue  # The first distribution on sys.path shadows the others
+            self.requirements[normalize_name(name)] = applicable_requirements(dist.requires or [])
+
+    def get_dependencies(self, package_name: str) -> List[str]:
+        """
+        Retrieve immediate package dependencies from the index.
+
+        Args:
+            package_name (str): The name of the package to retrieve dependencies for.
+
+        Returns:
+            List[str]: A list of dependencies for the given package, empty if it is not installed.
+        """
+        return list(self.requirements.get(normalize_name(package_name), []))
+
+    __call__ = get_dependencies
+
+
+def local_repository_path(repository_url: Optional[str]) -> Optional[str]:
+    """
+    Return the directory a repository URL points to if it is local.
+
+    Args:
+        repository_url (Optional[str]): A ``file://`` URL or a directory path.
+
+    Returns:
+        Optional[str]: The directory, or None for remote or missing repositories.
+    """
+    if not repository_url:
+        return None
+    path = repository_url.strip()
+    if path.startswith("file:"):
+        path = urllib.request.url2pathname(urllib.parse.urlparse(path).path)
+    return path if os.path.isdir(path) else None
+
+
+def version_key(version: str):
+    """Return a sort key ordering release versions, with a rough fallback without ``packaging``."""
+    if Version is not None:
+        try:
+            return (1, Version(version))
+        except InvalidVersion:
+            return (0, version)
+    return (1, tuple(int(part) if part.isdigit() else -1 for part in re.split(r"[.+-]", version)))
+
+
+def split_distribution_filename(filename: str) -> Optional[Tuple[str, str, bool]]:
+    """
+    Extract the project name and version from a wheel or sdist file name.
+
+    Args:
+        filename (str): A file name such as ``requests-2.31.0-py3-none-any.whl``.
+
+    Returns:
+        Optional[Tuple[str, str, bool]]: The name, the version and whether it is a wheel,
+            or None if the file is not a distribution.
+    """
+    if filename.endswith(".whl"):
+        parts = filename[:-len(".whl")].split("-")
+        return (parts[0], parts[1], True) if len(parts) >= 5 else None
+    for suffix in SDIST_SUFFIXES:
+        if filename.endswith(suffix):
+            name, _, version = filename[:-len(suffix)].rpartition("-")
+            return (name, version, False) if name and version else None
+    return None
+
+
+def read_wheel_requirements(path: str) -> List[str]:
+    """
+    Read ``Requires-Dist`` from the ``METADATA`` of a wheel.
+
+    Only the central directory of the zip and the metadata member are read.
+
+    Args:
+        path (str): Path to the wheel.
+
+    Returns:
+        List[str]: The raw requirements.
+    """
+    with zipfile.ZipFile(path) as wheel:
+        for name in wheel.namelist():
+            parts = name.split("/")
+            if len(parts) == 2 and parts[0].endswith(".dist-info") and parts[1] == "METADATA":
+                metadata = HeaderParser().parsestr(wheel.read(name).decode("utf-8", errors="replace"))
+                return metadata.get_all("Requires-Dist") or []
+    return []
+
+
+def read_sdist_requirements(path: str) -> List[str]:
+    """
+    Read the requirements of a source distribution.
+
+    ``Requires-Dist`` of ``PKG-INFO`` is used when present, otherwise the
+    unconditional section of ``*.egg-info/requires.txt``. Tarballs are streamed
+    and reading stops as soon as the requirements are known.
+
+    Args:
+        path (str): Path to the sdist archive.
+
+    Returns:
+        List[str]: The raw requirements.
+    """
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            members = [(name, lambda name=name: archive.read(name)) for name in archive.namelist()]
+            return _sdist_requirements(members)
+    with tarfile.open(path, "r|*") as archive:
+        members = ((member.name, lambda member=member: archive.extractfile(member).read())
+                   for member in archive if member.isfile())
+        return _sdist_requirements(members)
+
+
+def _sdist_requirements(members) -> List[str]:
+    """Find the requirements among ``(name, read)`` pairs of the members of an sdist."""
+    requires_txt = None
+    for name, read in members:
+        parts = name.split("/")
+        if len(parts) == 2 and parts[1] == "PKG-INFO":
+            metadata = HeaderParser().parsestr(read().decode("utf-8", errors="replace"))
+            requirements = metadata.get_all("Requires-Dist")
+            if requirements:
+                return requirements
+        elif len(parts) >= 2 and parts[-2].endswith(".egg-info") and parts[-1] == "requires.txt" and requires_txt is None:
+            requires_txt = []
+            for line in read().decode("utf-8", errors="replace").splitlines():
+                line = line.strip()
+                if line.startswith("["):
+                    break  # Extras and markers start the conditional sections
+                if line:
+                    requires_txt.append(line)
+    return requires_txt or []
+
+
+class LocalRepositoryIndex:
+    """
+    Dependencies read from a local directory of wheels and sdists.
+
+    The directory may be a flat folder of distribution files or a mirror in the
+    simple index layout; every file below it is considered. The newest version
+    of each project is used, a wheel wins over an sdist of the same version.
+    Metadata is read from the files on demand and remembered.
+    """
+
+    def __init__(self, root: str, concurrency: int = DEFAULT_CONCURRENCY):
+        """
+        Args:
+            root (str): The repository directory.
+            concurrency (int): The maximum number of files read at the same time by :meth:`load_all`.
+        """
+        self.concurrency = concurrency
+        self.files: Dict[str, str] = {}
+        self.versions: Dict[str, str] = {}
+        self._requirements: Dict[str, List[str]] = {}
+        best = {}
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                parsed = split_distribution_filename(filename)
+                if parsed is None:
+                    continue
+                name, version, is_wheel = parsed
+                key = normalize_name(name)
+                rank = (version_key(version), is_wheel)
+                if key not in best or rank > best[key]:
+                    best[key] = rank
+                    self.files[key] = os.path.join(directory, filename)
+                    self.versions[key] = version
+
+    def _read(self, key: str) -> List[str]:
+        path = self.files[key]
+        try:
+            if path.endswith(".whl"):
+                requirements = read_wheel_requirements(path)
+            else:
+                requirements = read_sdist_requirements(path)
+        except (OSError, zipfile.BadZipFile, tarfile.TarError) as error:
+            print(f"Error: Could not read {path}: {error}")
+            requirements = []
+        return applicable_requirements(requirements)
+
+    def load_all(self) -> None:
+        """Read the metadata of every project of the repository in parallel."""
+        missing = [key for key in self.files if key not in self._requirements]
+        with ThreadPoolExecutor(max_workers=max(1, self.concurrency)) as pool:
+            for key, dependencies in zip(missing, pool.map(self._read, missing)):
+                self._requirements[key] = dependencies
+
+    def get_dependencies(self, package_name: str) -> List[str]:
+        """
+        Retrieve immediate package dependencies from the repository.
+
+        Args:
+            package_name (str): The name of the package to retrieve dependencies for.
+
+        Returns:
+            List[str]: A list of dependencies for the given package, empty if the repository does not have it.
+        """
+        key = normalize_name(package_name)
+        if key not in self.files:
+            return []
+        if key not in self._requirements:
+            self._requirements[key] = self._read(key)
+        return list(self._requirements[key])
+
+    __call__ = get_dependencies
+
+
+def site_packages_fingerprint(versions: Optional[Dict[str, str]] = None) -> str:
+    """
+    Fingerprint the installed distributions.
+
+    Installing, upgrading or removing a distribution changes the set of installed
+    names and versions; files written next to the script, such as the cache
+    database itself, do not.
+
+    Args:
+        versions (Optional[Dict[str, str]]): Installed versions by normalized name, read by default.
+
+    Returns:
+        str: A hash of the sorted name and version pairs.
+    """
+    if versions is None:
+        versions = installed_versions()
+    digest = hashlib.sha256()
+    for name, version in sorted(versions.items()):
+        digest.update(f"{name}\0{version}\n".encode())
+    return digest.hexdigest()
+
+
+def installed_versions() -> Dict[str, str]:
+    """
+    Map the normalized names of the installed distributions to their versions.
+
+    Returns:
+        Dict[str, str]: Versions of the distributions, the first one on ``sys.path`` wins.
+    """
+    versions = {}
+    for dist in importlib.metadata.distributions():
+        name = dist.metadata["Name"]
+        if name:
+            versions.setdefault(normalize_name(name), dist.version)
+    return versions
+
+
+class DependencyCache:
+    """
+    Persistent SQLite cache in front of a dependency resolver.
+
+    Entries are keyed by normalized distribution name and installed version.
+    The whole cache is dropped when the set of installed distributions changes,
+    so a repeated run over an unchanged environment does not resolve anything.
+    """
+
+    def __init__(
+        self,
+        resolver: Callable[[str], List[str]],
+        path: str = DEFAULT_CACHE_PATH,
+        fingerprint: Optional[str] = None,
+        versions: Optional[Dict[str, str]] = None,
+    ):
+        """
+        Args:
+            resolver (Callable[[str], List[str]]): Resolver used on a cache miss.
+            path (str): Path of the SQLite database.
+            fingerprint (Optional[str]): Fingerprint of the environment, computed from the versions by default.
+            versions (Optional[Dict[str, str]]): Installed versions by normalized name, read by default.
+        """
+        self.resolver = resolver
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._versions = versions
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS dependencies "
+            "(name TEXT, version TEXT, requires TEXT, PRIMARY KEY (name, version))"
+        )
+        if fingerprint is None:
+            self._versions = self._versions if self._versions is not None else installed_versions()
+            fingerprint = site_packages_fingerprint(self._versions)
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+        if row is None or row[0] != fingerprint:
+            self.connection.execute("DELETE FROM dependencies")
+            self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)", (fingerprint,))
+        self.connection.commit()
+
+    def version(self, package_name: str) -> str:
+        """Return the installed version of a package, empty if it is not installed."""
+        if self._versions is None:
+            self._versions = installed_versions()
+        return self._versions.get(normalize_name(package_name), "")
+
+    def get_dependencies(self, package_name: str) -> List[str]:
+        """
+        Retrieve immediate package dependencies, resolving them only on a cache miss.
+
+        Args:
+            package_name (str): The name of the package to retrieve dependencies for.
+
+        Returns:
+            List[str]: A list of dependencies for the given package.
+        """
+        key = (normalize_name(package_name), self.version(package_name))
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT requires FROM dependencies WHERE name = ? AND version = ?", key
+            ).fetchone()
+        if row is not None:
+            self.hits += 1
+            return json.loads(row[0])
+        self.misses += 1
+        dependencies = self.resolver(package_name)
+        with self._lock:
+            self.connection.execute("INSERT OR REPLACE INTO dependencies VALUES (?, ?, ?)", (*key, json.dumps(dependencies)))
+        return dependencies
+
+    __call__ = get_dependencies
+
+    def close(self) -> None:
+        """Commit the new entries and close the database."""
+        with self._lock:
+            self.connection.commit()
+            self.connection.close()
+
+
+class DependencyGraph:
+    """
+    Dependency graph stored as interned node ids and two parallel edge arrays.
+
+    Every package name is kept once; an edge costs two machine integers instead
+    of a formatted string, so memory stays small for graphs with many edges.
+    """
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.ids: Dict[str, int] = {}
+        self.sources = array("I")
+        self.targets = array("I")
+
+    def node(self, name: str) -> int:
+        """Return the id of a package, adding it to the graph if needed."""
+        node_id = self.ids.get(name)
+        if node_id is None:
+            node_id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return node_id
+
+    def add_edge(self, source: str, target: str) -> None:
+        """Add the edge ``source --> target``."""
+        self.sources.append(self.node(source))
+        self.targets.append(self.node(target))
+
+    def edges(self) -> Iterator[Tuple[str, str]]:
+        """Iterate over the edges as ``(source, target)`` names in insertion order."""
+        names = self.names
+        for source, target in zip(self.sources, self.targets):
+            yield names[source], names[target]
+
+    def edge_strings(self) -> List[str]:
+        """Return the edges formatted as ``A --> B``."""
+        return [f"{source} --> {target}" for source, target in self.edges()]
+
+    def __len__(self) -> int:
+        return len(self.sources)
+
+
+def resolve_dependency_graph(
+    package_name: str,
+    max_depth: int,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    resolver: Optional[Callable[[str], List[str]]] = None,
+) -> DependencyGraph:
+    """
+    Resolve the dependency graph of the package breadth-first.
+
+    The packages of one depth level are resolved concurrently. Every package is
+    resolved once, at the smallest depth it is reached, and only packages up to
+    ``max_depth`` are resolved. Edges are stored level by level in the order
+    the dependencies are declared, so the result does not depend on timing.
+
+    Args:
+        package_name (str): The name of the package to build the dependency graph for.
+        max_depth (int): The maximum depth of dependencies to traverse.
+        concurrency (int): The maximum number of packages resolved at the same time.
+        resolver (Optional[Callable[[str], List[str]]]): Returns the immediate dependencies
+            of a package, ``get_dependencies`` (pip) by default.
+
+    Returns:
+        DependencyGraph: The resolved graph.
+    """
+    resolver = resolver or get_dependencies
+    graph = DependencyGraph()
+    graph.node(package_name)
+    visited = {package_name}
+    level = [package_name]
+    current_depth = 1
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        while level and current_depth <= max_depth:
+            next_level = []
+            for pkg_name, dependencies in zip(level, pool.map(resolver, level)):
+                for dep in dependencies:
+                    graph.add_edge(pkg_name, dep)
+                    if dep not in visited:
+                        visited.add(dep)
+                        next_level.append(dep)
+            level = next_level
+            current_depth += 1
+    return graph
+
+
+def build_dependency_graph(
+    package_name: str,
+    max_depth: int,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    resolver: Optional[Callable[[str], List[str]]] = None,
+) -> List[str]:
     """
-    Recursively build the dependency graph for the package using PlantUML format.
+    Build the dependency graph for the package using PlantUML format.
 
     Args:
         package_name (str): The name of the package to build the dependency graph for.
         max_depth (int): The maximum depth of dependencies to traverse.
+        concurrency (int): The maximum number of packages resolved at the same time.
+        resolver (Optional[Callable[[str], List[str]]]): Returns the immediate dependencies
+            of a package, ``get_dependencies`` (pip) by default.
 
     Returns:
         List[str]: A list of strings representing the dependency relationships in PlantUML format.
     """
-    graph = []
-    visited = set()
+    return resolve_dependency_graph(package_name, max_depth, concurrency, resolver).edge_strings()
 
-    def add_dependencies(pkg_name: str, current_depth: int):
-        if current_depth > max_depth or pkg_name in visited:
-            return
-        visited.add(pkg_name)
 
-        dependencies = get_dependencies(pkg_name)
-        for dep in dependencies:
-            graph.append(f"{pkg_name} --> {dep}")
-            add_dependencies(dep, current_depth + 1)
+def iter_mermaid(graph: DependencyGraph) -> Iterator[str]:
+    """Generate the lines of a Mermaid flowchart of the graph."""
+    yield "graph TD\n"
+    for source, target in graph.edges():
+        yield f"    {source} --> {target}\n"
+
+
+def iter_plantuml(graph: DependencyGraph) -> Iterator[str]:
+    """Generate the lines of a PlantUML component diagram of the graph."""
+    yield "@startuml\n"
+    for source, target in graph.edges():
+        yield f"[{source}] --> [{target}]\n"
+    yield "@enduml\n"
+
+
+def iter_dot(graph: DependencyGraph) -> Iterator[str]:
+    """Generate the lines of a Graphviz DOT digraph of the graph."""
+    yield "digraph dependencies {\n"
+    for source, target in graph.edges():
+        source = source.replace('"', '\\"')
+        target = target.replace('"', '\\"')
+        yield f'    "{source}" -> "{target}";\n'
+    yield "}\n"
 
-    add_dependencies(package_name, 1)
-    return graph
+
+EMITTERS = {
+    "mermaid": iter_mermaid,
+    "plantuml": iter_plantuml,
+    "dot": iter_dot,
+}
+
+
+def write_graph(graph: DependencyGraph, file: TextIO, fmt: str = "mermaid") -> None:
+    """
+    Stream the graph in the given format to an open file.
+
+    Args:
+        graph (DependencyGraph): The graph to write.
+        file (TextIO): The destination.
+        fmt (str): ``mermaid``, ``plantuml`` or ``dot``.
+    """
+    if fmt not in EMITTERS:
+        raise ValueError(f"Unknown output format: {fmt}")
+    file.writelines(EMITTERS[fmt](graph))
 
 
 def generate_mermaid_script(graph: List[str]) -> str:
@@ -91,10 +700,7 @@ def generate_mermaid_script(graph: List[str]) -> str:
     Returns:
         str: The generated Mermaid script.
     """
-    mermaid_script = "graph TD\n"
-    for relation in graph:
-        mermaid_script += f"    {relation}\n"
-    return mermaid_script
+    return "graph TD\n" + "".join(f"    {relation}\n" for relation in graph)
 
 
 def save_mermaid_script(script: str, output_path: str) -> None:
@@ -109,7 +715,7 @@ def save_mermaid_script(script: str, output_path: str) -> None:
         f.write(script)
 
 
-def visualize_graph(visualizer_path: str, script_path: str) -> None:
+def visualize_graph(visualizer_path: str, script_path: str, output_path: str = IMAGE_PATH) -> bool:
     """
     Generates mermaid Diagram from script.
     Using mmdc (Mermaid CLI).
@@ -117,36 +723,583 @@ def visualize_graph(visualizer_path: str, script_path: str) -> None:
     Args:
         script_path (str): path to .mmd file.
         visualizer_path (str): path to visualizer program.
+        output_path (str): path to the generated image.
+
+    Returns:
+        bool: Whether the visualizer succeeded.
     """
-    result = subprocess.run(f"{visualizer_path} -i {script_path} -o mermaid_graph.png", capture_output=True, shell=True)
+    start = time.perf_counter()
+    result = subprocess.run(f"{visualizer_path} -i {script_path} -o {output_path}", capture_output=True, shell=True)
+    if profiler is not None:
+        profiler.record_render(time.perf_counter() - start)
     if result.returncode == 0:
-        print("Diagram saved to mermaid_graph.png")
-    else:
-        print(f"Error during generation: {result.stderr.decode('utf-8', errors='ignore')}")
+        print(f"Diagram saved to {output_path}")
+        return True
+    print(f"Error during generation: {result.stderr.decode('utf-8', errors='ignore')}")
+    return False
+
+
+def render_graphs(visualizer_path: str, jobs: List[Tuple[str, str]], processes: Optional[int] = None) -> List[bool]:
+    """
+    Render several mermaid scripts, running the visualizer in a process pool.
+
+    Args:
+        visualizer_path (str): path to visualizer program.
+        jobs (List[Tuple[str, str]]): ``(script_path, output_path)`` pairs.
+        processes (Optional[int]): The size of the pool, the number of CPUs by default.
+
+    Returns:
+        List[bool]: Whether each job succeeded.
+    """
+    if len(jobs) <= 1 or processes == 1:
+        return [visualize_graph(visualizer_path, script_path, output_path) for script_path, output_path in jobs]
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        results = list(executor.map(visualize_graph, repeat(visualizer_path), *zip(*jobs)))
+    if profiler is not None:
+        # The workers' own counters stay in their processes
+        profiler.record_render(time.perf_counter() - start, renders=len(jobs))
+    return results
+
+
+def read_requirements_file(path: str) -> List[str]:
+    """
+    Read the project names of a requirements file.
+
+    Comments, options (``-r``, ``--index-url``...) and requirements whose marker does
+    not apply to the running interpreter are skipped.
+
+    Args:
+        path (str): Path to the requirements file.
+
+    Returns:
+        List[str]: The project names in file order.
+    """
+    names = []
+    with open(path, "r") as file:
+        for line in file:
+            line = line.split("#", 1)[0].strip()
+            if not line or line.startswith("-"):
+                continue
+            parsed = parse_requirement(line)
+            if parsed is not None and marker_applies(parsed[1]):
+                names.append(parsed[0])
+    return names
+
+
+def root_packages(config: Dict[str, str]) -> List[str]:
+    """
+    Collect the root packages of a run.
+
+    Args:
+        config (Dict[str, str]): The parsed configuration.
+
+    Returns:
+        List[str]: ``package_name``, then ``packages``, then the requirements file entries,
+            without duplicates (compared by normalized name).
+    """
+    candidates = [config["package_name"]] if config.get("package_name") else []
+    candidates.extend(config.get("packages", []))
+    if config.get("requirements_file"):
+        candidates.extend(read_requirements_file(config["requirements_file"]))
+    roots = []
+    seen = set()
+    for name in candidates:
+        if normalize_name(name) not in seen:
+            seen.add(normalize_name(name))
+            roots.append(name)
+    return roots
+
+
+class MemoizedResolver:
+    """
+    Dependency table shared by all the roots of a run.
+
+    Every package is resolved once, however many roots pull it in.
+    """
+
+    def __init__(self, resolver: Callable[[str], List[str]]):
+        """
+        Args:
+            resolver (Callable[[str], List[str]]): Resolver for the packages not seen yet.
+        """
+        self.resolver = resolver
+        self.table: Dict[str, List[str]] = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get_dependencies(self, package_name: str) -> List[str]:
+        """
+        Retrieve immediate package dependencies, resolving each package once.
+
+        Args:
+            package_name (str): The name of the package to retrieve dependencies for.
+
+        Returns:
+            List[str]: A list of dependencies for the given package.
+        """
+        key = normalize_name(package_name)
+        with self._lock:
+            if key in self.table:
+                self.hits += 1
+                return self.table[key]
+        dependencies = self.resolver(package_name)
+        with self._lock:
+            self.misses += 1
+            self.table[key] = dependencies
+        return dependencies
+
+    __call__ = get_dependencies
+
+
+def merge_graphs(graphs: Iterable[DependencyGraph]) -> DependencyGraph:
+    """
+    Build the union of several dependency graphs.
+
+    Args:
+        graphs (Iterable[DependencyGraph]): The graphs to merge.
+
+    Returns:
+        DependencyGraph: Every package and every distinct edge, in first-seen order.
+    """
+    union = DependencyGraph()
+    seen = set()
+    for graph in graphs:
+        for name in graph.names:
+            union.node(name)
+        for edge in graph.edges():
+            if edge not in seen:
+                seen.add(edge)
+                union.add_edge(*edge)
+    return union
+
+
+def batch_path(path: str, label: str) -> str:
+    """Insert a label before the extension of an output path, e.g. ``mermaid_script_requests.mmd``."""
+    base, extension = os.path.splitext(path)
+    return f"{base}_{label}{extension}"
+
+
+def run_batch(
+    config: Dict[str, str], roots: List[str], resolver: Callable[[str], List[str]]
+) -> Tuple[Dict[str, DependencyGraph], MemoizedResolver]:
+    """
+    Build one graph per root package and their union, against one shared dependency table.
+
+    Every root gets its outputs suffixed with its normalized name, the union graph uses
+    the default output paths. The incremental ``state_path`` only applies to single-root runs.
+
+    Args:
+        config (Dict[str, str]): The parsed configuration.
+        roots (List[str]): The root packages.
+        resolver (Callable[[str], List[str]]): The dependency resolver.
+
+    Returns:
+        Tuple[Dict[str, DependencyGraph], MemoizedResolver]: The graph of every root and
+            the shared dependency table.
+    """
+    concurrency = config.get("concurrency", DEFAULT_CONCURRENCY)
+    formats = config.get("formats", ["mermaid"])
+    shared = MemoizedResolver(resolver)
+    graphs = {root: resolve_dependency_graph(root, config["max_depth"], concurrency, shared) for root in roots}
+    union = merge_graphs(graphs.values())
+    print(f"Resolved {len(shared.table)} packages for {len(roots)} roots, {shared.hits} lookups shared")
+
+    outputs = [(normalize_name(root), graph) for root, graph in graphs.items()] + [(None, union)]
+    if config.get("analysis_path") or config.get("reduce"):
+        from graph_analysis import analyze, transitive_reduction
+        if config.get("analysis_path"):
+            with open(config["analysis_path"], "w") as file:
+                json.dump(analyze(union), file, indent=2)
+        if config.get("reduce"):
+            outputs = [(label, transitive_reduction(graph)) for label, graph in outputs]
+
+    jobs = []
+    for label, graph in outputs:
+        for fmt in formats:
+            path = OUTPUT_PATHS[fmt] if label is None else batch_path(OUTPUT_PATHS[fmt], label)
+            with open(path, "w") as file:
+                write_graph(graph, file, fmt)
+        if "mermaid" in formats:
+            script_path = OUTPUT_PATHS["mermaid"] if label is None else batch_path(OUTPUT_PATHS["mermaid"], label)
+            jobs.append((script_path, IMAGE_PATH if label is None else batch_path(IMAGE_PATH, label)))
+    render_graphs(config["visualizer_path"], jobs, config.get("render_processes"))
+    return graphs, shared
+
+
+class IncrementalResolver:
+    """
+    Resolver reusing the dependencies stored by the previous run.
+
+    Packages whose installed version did not change get their stored
+    dependencies back; changed packages and packages the previous run did not
+    resolve (e.g. newly reachable ones) go to the wrapped resolver.
+    """
+
+    def __init__(self, resolver: Callable[[str], List[str]], previous: Dict[str, List[str]], changed: Iterable[str]):
+        """
+        Args:
+            resolver (Callable[[str], List[str]]): Resolver for changed and unknown packages.
+            previous (Dict[str, List[str]]): Dependencies resolved by the previous run.
+            changed (Iterable[str]): Normalized names of the packages whose version changed.
+        """
+        self.resolver = resolver
+        self.previous = previous
+        self.changed = set(changed)
+        self.dependencies: Dict[str, List[str]] = {}
+        self.reused = 0
+        self.resolved = 0
+        self._lock = threading.Lock()
+
+    def get_dependencies(self, package_name: str) -> List[str]:
+        """
+        Retrieve immediate package dependencies, resolving only changed or unknown packages.
+
+        Args:
+            package_name (str): The name of the package to retrieve dependencies for.
+
+        Returns:
+            List[str]: A list of dependencies for the given package.
+        """
+        if package_name in self.previous and normalize_name(package_name) not in self.changed:
+            dependencies = self.previous[package_name]
+            with self._lock:
+                self.reused += 1
+        else:
+            dependencies = self.resolver(package_name)
+            with self._lock:
+                self.resolved += 1
+        self.dependencies[package_name] = dependencies
+        return dependencies
+
+    __call__ = get_dependencies
+
+
+def load_graph_state(state_path: str) -> Optional[Dict]:
+    """
+    Load the state saved by the previous incremental run.
+
+    Args:
+        state_path (str): Path to the JSON state file.
+
+    Returns:
+        Optional[Dict]: The state, or None if there is no usable state.
+    """
+    try:
+        with open(state_path, "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def save_graph_state(state_path: str, state: Dict) -> None:
+    """
+    Save the state of an incremental run, replacing the previous one atomically.
+
+    Args:
+        state_path (str): Path to the JSON state file.
+        state (Dict): The root, the maximum depth, the package versions, the resolved
+            dependencies and the hashes of the emitted outputs.
+    """
+    temp_path = state_path + ".tmp"
+    with open(temp_path, "w") as file:
+        json.dump(state, file)
+    os.replace(temp_path, state_path)
+
+
+def changed_packages(previous: Dict[str, str], current: Dict[str, str]) -> List[str]:
+    """
+    Compare two ``normalized name -> version`` maps.
+
+    Returns:
+        List[str]: Sorted names of the added, removed and upgraded packages.
+    """
+    return sorted(name for name in previous.keys() | current.keys() if previous.get(name) != current.get(name))
+
+
+def output_hash(graph: DependencyGraph, fmt: str) -> str:
+    """Return the SHA-256 of the text a format emits for a graph, without keeping the text."""
+    digest = hashlib.sha256()
+    for chunk in EMITTERS[fmt](graph):
+        digest.update(chunk.encode())
+    return digest.hexdigest()
+
+
+class Profiler:
+    """
+    Timing report of a run: resolve latency per package, cache counters,
+    subprocess calls, rendering time and depth distribution.
+    """
+
+    def __init__(self):
+        self.latencies: Dict[str, float] = {}
+        self.subprocess_calls = 0
+        self.render_time = 0.0
+        self.renders = 0
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def wrap(self, resolver: Callable[[str], List[str]]) -> Callable[[str], List[str]]:
+        """
+        Time every call of a resolver.
 
+        Args:
+            resolver (Callable[[str], List[str]]): The resolver to measure.
 
-def main(config_path: str) -> None:
+        Returns:
+            Callable[[str], List[str]]: A resolver recording the latency of each package.
+                It exposes the wrapped resolver as ``resolver``.
+        """
+        def timed(package_name: str) -> List[str]:
+            start = time.perf_counter()
+            try:
+                return resolver(package_name)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self.latencies[package_name] = self.latencies.get(package_name, 0.0) + elapsed
+
+        timed.resolver = resolver
+        return timed
+
+    def count_subprocess(self) -> None:
+        """Count one spawned subprocess."""
+        with self._lock:
+            self.subprocess_calls += 1
+
+    def record_render(self, elapsed: float, renders: int = 1) -> None:
+        """Add rendering time, each render spawning one subprocess."""
+        with self._lock:
+            self.render_time += elapsed
+            self.renders += renders
+            self.subprocess_calls += renders
+
+    @staticmethod
+    def cache_counters(resolver: Callable[[str], List[str]]) -> Dict[str, Dict[str, int]]:
+        """
+        Collect the hit/miss counters along a chain of wrapping resolvers.
+
+        Args:
+            resolver (Callable[[str], List[str]]): The outermost resolver.
+
+        Returns:
+            Dict[str, Dict[str, int]]: ``hits`` and ``misses`` per resolver class.
+        """
+        counters = {}
+        while resolver is not None:
+            if hasattr(resolver, "hits"):
+                counters[type(resolver).__name__] = {"hits": resolver.hits, "misses": resolver.misses}
+            elif isinstance(resolver, IncrementalResolver):
+                counters[type(resolver).__name__] = {"hits": resolver.reused, "misses": resolver.resolved}
+            resolver = getattr(resolver, "resolver", None)
+        return counters
+
+    def report(self, graphs: Dict[str, DependencyGraph], resolvers: Iterable[Callable[[str], List[str]]]) -> Dict:
+        """
+        Build the JSON report.
+
+        Args:
+            graphs (Dict[str, DependencyGraph]): The resolved graph of every root package.
+            resolvers (Iterable[Callable[[str], List[str]]]): Resolvers to read cache counters from.
+
+        Returns:
+            Dict: The report, packages sorted from the slowest.
+        """
+        from graph_analysis import depth_distribution
+
+        latencies = sorted(self.latencies.items(), key=lambda item: (-item[1], item[0]))
+        caches = {}
+        for resolver in resolvers:
+            caches.update(self.cache_counters(resolver))
+        return {
+            "wall_time_s": time.perf_counter() - self.started,
+            "resolved_packages": len(latencies),
+            "resolve_time_s": sum(self.latencies.values()),
+            "latencies_s": dict(latencies),
+            "caches": caches,
+            "subprocess_calls": self.subprocess_calls,
+            "renders": self.renders,
+            "render_time_s": self.render_time,
+            "depth_distribution": {root: depth_distribution(graph, root) for root, graph in graphs.items()},
+        }
+
+    @staticmethod
+    def summary(report: Dict, limit: int = 10) -> str:
+        """
+        Format a report for the terminal.
+
+        Args:
+            report (Dict): A report built by :meth:`report`.
+            limit (int): The number of slowest packages listed.
+
+        Returns:
+            str: The human-readable summary.
+        """
+        lines = [
+            f"Total: {report['wall_time_s']:.3f} s, resolving {report['resolved_packages']} packages: "
+            f"{report['resolve_time_s']:.3f} s, rendering {report['renders']} diagrams: {report['render_time_s']:.3f} s",
+            f"Subprocesses: {report['subprocess_calls']}",
+        ]
+        for name, counters in report["caches"].items():
+            lines.append(f"{name}: {counters['hits']} hits, {counters['misses']} misses")
+        for root, distribution in report["depth_distribution"].items():
+            levels = ", ".join(f"{depth}: {count}" for depth, count in distribution.items())
+            lines.append(f"Packages per depth from {root}: {levels}")
+        lines.append("Slowest packages:")
+        for name, latency in list(report["latencies_s"].items())[:limit]:
+            lines.append(f"    {latency * 1000:9.1f} ms  {name}")
+        return "\n".join(lines)
+
+
+def create_resolver(config: Dict[str, str]) -> Callable[[str], List[str]]:
+    """
+    Create the dependency resolver selected by the configuration.
+
+    ``<backend>pip</backend>`` uses ``pip show``, a local ``repository_url`` reads the
+    metadata of the whole repository offline, ``concurrency`` files at a time, and
+    otherwise the installed distributions are indexed in-process.
+    ``pip show`` is wrapped in a :class:`DependencyCache` unless ``cache_path`` is empty;
+    the in-process index reads all the metadata up front, a cache would only add work.
+
+    Args:
+        config (Dict[str, str]): The parsed configuration.
+
+    Returns:
+        Callable[[str], List[str]]: The resolver.
+    """
+    concurrency = config.get("concurrency", DEFAULT_CONCURRENCY)
+    repository_path = local_repository_path(config["repository_url"])
+    cache_path = config.get("cache_path", DEFAULT_CACHE_PATH)
+    if config.get("backend") == "pip":
+        return DependencyCache(get_dependencies, cache_path) if cache_path else get_dependencies
+    if repository_path is not None:
+        # Offline graph of the packages of a local repository, they do not need to be installed
+        index = LocalRepositoryIndex(repository_path, concurrency)
+        index.load_all()
+        return index
+    return MetadataIndex()
+
+
+def main(config_path: str, profile_path: Optional[str] = None) -> None:
     """
     Main function to build and visualize the dependency graph for a Python package.
 
     Args:
         config_path (str): Path to the XML configuration file.
+        profile_path (Optional[str]): Path of the JSON profiling report, profiling is off by default.
+    """
+    global profiler
+    if profile_path is None:
+        run(config_path)
+        return
+    profiler = Profiler()
+    try:
+        graphs, resolvers = run(config_path)
+        report = profiler.report(graphs, resolvers)
+    finally:
+        profiler = None
+    with open(profile_path, "w") as file:
+        json.dump(report, file, indent=2)
+    print(Profiler.summary(report))
+    print(f"Profile saved to {profile_path}")
+
+
+def run(config_path: str) -> Tuple[Dict[str, DependencyGraph], List[Callable[[str], List[str]]]]:
+    """
+    Build and visualize the dependency graphs described by a configuration.
+
+    Args:
+        config_path (str): Path to the XML configuration file.
+
+    Returns:
+        Tuple[Dict[str, DependencyGraph], List[Callable[[str], List[str]]]]: The resolved graph
+            of every root package and the resolvers used, for the profiling report.
     """
     config = parse_xml_config(config_path)
-    package_name = config["package_name"]
+    roots = root_packages(config)
+    if not roots:
+        raise ValueError("No package_name, packages or requirements_file in the configuration")
+    package_name = roots[0]
     max_depth = config["max_depth"]
     visualizer_path = config["visualizer_path"]
+    concurrency = config.get("concurrency", DEFAULT_CONCURRENCY)
+    formats = config.get("formats", ["mermaid"])
+    for fmt in formats:
+        if fmt not in EMITTERS:
+            raise ValueError(f"Unknown output format: {fmt}")
+
+    resolver = create_resolver(config)
+    measured = profiler.wrap(resolver) if profiler is not None else resolver
+    if len(roots) > 1:
+        graphs, shared = run_batch(config, roots, measured)
+        if isinstance(resolver, DependencyCache):
+            resolver.close()
+        return graphs, [shared]
+
+    state_path = config.get("state_path")
+    state = load_graph_state(state_path) if state_path else None
+    if state is not None and (state.get("root"), state.get("max_depth")) != (package_name, max_depth):
+        state = None
+    if state_path:
+        if isinstance(resolver, LocalRepositoryIndex):
+            versions = resolver.versions
+        else:
+            versions = installed_versions()
+        changed = changed_packages(state["versions"], versions) if state else []
+        incremental = IncrementalResolver(measured, state["dependencies"] if state else {}, changed)
+        graph = resolve_dependency_graph(package_name, max_depth, concurrency, incremental)
+        print(f"Changed packages: {len(changed)}, resolved: {incremental.resolved}, reused: {incremental.reused}")
+    else:
+        graph = resolve_dependency_graph(package_name, max_depth, concurrency, measured)
+    resolved = graph
+    if isinstance(resolver, DependencyCache):
+        resolver.close()
 
-    graph = build_dependency_graph(package_name, max_depth)
+    if config.get("analysis_path") or config.get("reduce"):
+        from graph_analysis import analyze, transitive_reduction
+        if config.get("analysis_path"):
+            with open(config["analysis_path"], "w") as file:
+                json.dump(analyze(graph, package_name), file, indent=2)
+        if config.get("reduce"):
+            graph = transitive_reduction(graph)
 
-    mermaid_script = generate_mermaid_script(graph)
+    # Outputs whose text did not change since the previous incremental run are not rewritten
+    previous_hashes = state.get("hashes", {}) if state else {}
+    hashes = {}
+    written = []
+    for fmt in formats:
+        hashes[fmt] = output_hash(graph, fmt) if state_path else None
+        if hashes[fmt] is not None and previous_hashes.get(fmt) == hashes[fmt] and os.path.exists(OUTPUT_PATHS[fmt]):
+            continue
+        with open(OUTPUT_PATHS[fmt], "w") as file:
+            write_graph(graph, file, fmt)
+        written.append(fmt)
 
-    script_path = "mermaid_script.mmd"
-    save_mermaid_script(mermaid_script, script_path)
+    # The script hash is only kept once the image was rendered from it
+    if "mermaid" in written or "mermaid" in formats and not os.path.exists(IMAGE_PATH):
+        if not visualize_graph(visualizer_path, OUTPUT_PATHS["mermaid"], IMAGE_PATH):
+            hashes["mermaid"] = None
+    elif "mermaid" in formats:
+        print(f"Dependency graph unchanged, {IMAGE_PATH} is up to date")
 
-    visualize_graph(visualizer_path, script_path)
+    if state_path:
+        save_graph_state(state_path, {
+            "root": package_name,
+            "max_depth": max_depth,
+            "versions": versions,
+            "dependencies": incremental.dependencies,
+            "hashes": hashes,
+        })
+    return {package_name: resolved}, [incremental if state_path else measured]
 
 
 if __name__ == "__main__":
-    config_path = "config.xml"  # Path to your XML config file
-    main(config_path)
+    parser = argparse.ArgumentParser(description="Python package dependency visualizer")
+    parser.add_argument("config", nargs="?", default="config.xml", help="Path to your XML config file")
+    parser.add_argument(
+        "--profile", nargs="?", const=DEFAULT_PROFILE_PATH, metavar="REPORT",
+        help=f"Write a timing report, {DEFAULT_PROFILE_PATH} by default"
+    )
+    args = parser.parse_args()
+    main(args.config, args.profile)
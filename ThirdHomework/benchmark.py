@@ -0,0 +1,159 @@
+import argparse
+import json
+import math
+import sys
+import timeit
+from typing import Callable, Dict, List, Optional
+
+from main import Loader, compile_tokens, tokenize
+
+# Levels of one chain of the deep corpus, well below the recursion limit of the parser and of the YAML emitter
+CHAIN_LEVELS = 150
+COMMENT = "(* a comment; with \"quotes\", dots. and => arrows, " + "padding " * 40 + "*)"
+WIDE_VALUES = ('1', '"text"', '{ 1. 2. 3 }', '[ a => 1, b => "x" ]', '@(+ x 1)')
+FLAT_STATEMENT = 'set item{0} = [ name => "host{0}", port => {0}, tags => {{ "a". "b". {0} }}, memory => @(* 2 512) ];\n'
+
+
+def flat_text(size: int) -> str:
+    """``size`` short table statements: the shape of a real configuration, many small values side by side."""
+    return "".join(FLAT_STATEMENT.format(index) for index in range(size))
+
+
+def deep_value(size: int) -> str:
+    """An array of chains of ``CHAIN_LEVELS`` alternately nested tables and arrays, ``size`` levels in all."""
+    chain = "2"
+    for level in range(CHAIN_LEVELS):
+        chain = f"{{ {level}. {chain} }}" if level % 2 else f"[ n => {level}, k => {chain} ]"
+    return "{ " + ". ".join([chain] * max(1, size // CHAIN_LEVELS)) + " }"
+
+
+def wide_value(size: int) -> str:
+    """A table of ``size`` keys with values of every kind."""
+    return "[ " + ", ".join(f"k{index} => {WIDE_VALUES[index % len(WIDE_VALUES)]}" for index in range(size)) + " ]"
+
+
+def comments_value(size: int) -> str:
+    """A table of ``size`` keys, each one after a long comment."""
+    return "[ " + ", ".join(f"{COMMENT} k{index} => {index}" for index in range(size)) + " ]"
+
+
+def expressions_value(size: int) -> str:
+    """An expression of ``size`` operands; they refer to ``x``, so the expression is not folded while parsed."""
+    return "@(+ " + " ".join(f"@(* x @(mod {index} 7))" for index in range(size)) + ")"
+
+
+# Corpus name -> its large value; the flat corpus has none and is generated by flat_text
+VALUES: Dict[str, Callable[[int], str]] = {
+    "deep": deep_value,
+    "wide": wide_value,
+    "comments": comments_value,
+    "expressions": expressions_value,
+}
+CORPORA = ("flat", *VALUES)
+
+
+def corpus_text(corpus: str, size: int) -> str:
+    """Whole trainee text of a corpus: the flat statements, or ``x`` and the large value."""
+    if corpus == "flat":
+        return flat_text(size)
+    return f"set x = 3;\nset value = {VALUES[corpus](size)};\n"
+
+
+def measured_calls(corpus: str, size: int) -> Dict[str, Callable[[], object]]:
+    """
+    Prepare the calls measured on a corpus of one size.
+    :param corpus: Name of the corpus.
+    :param size: Statements, levels, keys or operands of the corpus.
+    :return: Call without arguments per name of the function it measures.
+    """
+    text = corpus_text(corpus, size)
+    struct = Loader.load_trainee(text)
+    calls = {
+        "load_trainee": lambda: Loader.load_trainee(text),
+        "get_yaml": lambda: Loader.get_yaml(struct),
+    }
+    if corpus == "deep":
+        items = deep_value(size)[1:-1]
+        calls["split_array_items"] = lambda: Loader.split_array_items(items)
+    elif corpus in ("wide", "comments"):
+        items = VALUES[corpus](size)[1:-1]
+        calls["split_table_items"] = lambda: Loader.split_table_items(items)
+    elif corpus == "expressions":
+        operands = tokenize(expressions_value(size))[1:-2]  # without "@(", ")" and the end
+        constants = {"x": 3}
+
+        def evaluate():
+            # Operands are compiled through the compile_tokens cache, a repeated call would only hit it
+            compile_tokens.cache_clear()
+            return Loader.evaluate_expression(operands, constants)
+
+        calls["evaluate_expression"] = evaluate
+    return calls
+
+
+def seconds_per_call(call: Callable[[], object]) -> float:
+    """Time a call, letting timeit loop the small inputs until the measurement lasts 0.2 s."""
+    loops, total = timeit.Timer(call).autorange()
+    return total / loops
+
+
+def growth(points: List[Dict[str, float]]) -> Optional[float]:
+    """
+    Slope of log(seconds) over log(size), by least squares.
+    :param points: Measurements with ``size`` and ``seconds``.
+    :return: About 1 when the time grows linearly and 2 when it grows quadratically; None for a single size.
+    """
+    logs = [(math.log(point["size"]), math.log(point["seconds"])) for point in points]
+    mean_size = sum(size for size, _ in logs) / len(logs)
+    mean_seconds = sum(seconds for _, seconds in logs) / len(logs)
+    variance = sum((size - mean_size) ** 2 for size, _ in logs)
+    if not variance:
+        return None
+    return sum((size - mean_size) * (seconds - mean_seconds) for size, seconds in logs) / variance
+
+
+def scaling_curves(corpora: List[str], sizes: List[int]) -> Dict[str, Dict[str, dict]]:
+    """
+    Measure every function on every corpus it applies to, at every size.
+    :param corpora: Names of the corpora.
+    :param sizes: Sizes of the corpora, increasing.
+    :return: Function name -> corpus name -> its points (size, bytes, seconds, MB/s) and growth.
+    """
+    curves: Dict[str, Dict[str, dict]] = {}
+    for corpus in corpora:
+        for size in sizes:
+            text_bytes = len(corpus_text(corpus, size).encode('utf-8'))
+            for function, call in measured_calls(corpus, size).items():
+                seconds = seconds_per_call(call)
+                curve = curves.setdefault(function, {}).setdefault(corpus, {"points": []})
+                curve["points"].append({
+                    "size": size,
+                    "bytes": text_bytes,
+                    "seconds": seconds,
+                    "megabytes_per_second": text_bytes / seconds / 1e6,
+                })
+    for by_corpus in curves.values():
+        for curve in by_corpus.values():
+            curve["growth"] = growth(curve["points"])
+    return curves
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scaling curves of the trainee translator on generated texts")
+    parser.add_argument("-c", "--corpora", nargs="+", choices=CORPORA, default=list(CORPORA), help="Texts to generate")
+    parser.add_argument(
+        "-s", "--sizes", nargs="+", type=int, default=[1000, 4000, 16000],
+        help="Statements (flat), nesting levels (deep), keys (wide, comments) or operands (expressions)"
+    )
+    parser.add_argument("-o", "--output", help="JSON report, '-' for standard output (the default)")
+    args = parser.parse_args()
+
+    report = json.dumps({
+        "python": sys.version.split()[0],
+        "curves": scaling_curves(args.corpora, sorted(args.sizes)),
+    }, indent=2)
+    if args.output and args.output != "-":
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(report + "\n")
+    else:
+        print(report)
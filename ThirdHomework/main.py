@@ -1,269 +1,1117 @@
+import argparse
+import glob
+import hashlib
+import heapq
+import json
 import os
-from typing import Any
+import string
+import sys
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, reduce
+from typing import Any, Callable, Dict, Iterator, List, Optional, TextIO, Tuple
 import yaml
 import operator
 import re
 
+# libyaml emitter when PyYAML was built with it
+try:
+    from yaml import CDumper as YamlDumper
+except ImportError:
+    from yaml import Dumper as YamlDumper
+
+# Leading whitespace and comments, then a single token; any other character is a token of its own
+# and the end of the text is the empty token END
+TOKEN_PATTERN = re.compile(r'''\s*(?:\(\*.*?\*\)\s*)*(
+      \(\*                # comment without its end
+    | -?[0-9]+            # integer
+    | "[^"\n]*"           # string
+    | [_a-zA-Z][_a-zA-Z0-9]*
+    | =>
+    | @\(
+    | \S
+    | \Z
+)''', re.VERBOSE | re.DOTALL)
+NAME_START = frozenset(string.ascii_letters + "_")
+DIGITS = frozenset(string.digits)
+OPENING = frozenset(("{", "[", "(", "@("))
+CLOSING = frozenset(("}", "]", ")"))
+END = ""  # token after the last one
+OUTPUT_FORMATS = {"yaml": ".yaml", "json": ".json", "jsonl": ".jsonl"}
+SOURCE_SUFFIXES = (".trn",)  # files converted when a directory is given in batch mode
+DEFAULT_MANIFEST = "trainee_manifest.json"
+# Source text of one statement up to its ';', lexed as TOKEN_PATTERN does: "@(" before comments, then
+# comments and strings; a lone '@', '(' or '"' only where those cannot start, so nothing backtracks
+STATEMENT_PATTERN = re.compile(r'''[^;"(@]*(?:(?:
+      @\(
+    | \(\*.*?\*\)
+    | "[^"\n]*"
+    | @(?!\()
+    | \((?!\*)
+    | "(?![^"\n]*")
+)[^;"(@]*)*;''', re.VERBOSE | re.DOTALL)
+
+
+def number(name: str, value: Any) -> Any:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{name}() expects a number")
+    return value
+
+
+def character(value: Any) -> int:
+    if not isinstance(value, str) or len(value) != 1:
+        raise ValueError("ord() expects a single character")
+    return ord(value)
+
+
+def subtract(first: Any, *rest: Any) -> Any:
+    return reduce(operator.sub, rest, first) if rest else -first
+
+
+def concat(*values: Any) -> str:
+    return "".join(str(value) for value in values)
+
+
+# name -> (minimum operands, maximum operands or None, function); operators fold left over their operands
+OPERATORS: Dict[str, Tuple[int, Optional[int], Callable]] = {
+    "+": (2, None, lambda *values: reduce(operator.add, values)),
+    "-": (1, None, subtract),
+    "*": (2, None, lambda *values: reduce(operator.mul, values)),
+    "/": (2, None, lambda *values: reduce(operator.truediv, values)),
+}
+FUNCTIONS: Dict[str, Tuple[int, Optional[int], Callable]] = {
+    "abs": (1, 1, lambda value: abs(number("abs", value))),
+    "ord": (1, 1, character),
+    "chr": (1, 1, lambda value: chr(number("chr", value))),
+    "len": (1, 1, len),
+    "min": (1, None, min),
+    "max": (1, None, max),
+    "mod": (2, 2, operator.mod),
+    "pow": (2, 2, pow),
+    "concat": (1, None, concat),
+}
+CALLABLES = {**OPERATORS, **FUNCTIONS}
+
+
+class TrainParseError(ValueError):
+    """
+    Syntax or evaluation error in a trainee text, located by line and column (both start at 1).
+    """
+    def __init__(self, message: str, index: int = -1):
+        super().__init__(message)
+        self.message = message
+        self.index = index  # token index, turned into line and column by Parser.locate
+        self.line = 0
+        self.column = 0
+
+    def __str__(self):
+        if self.line:
+            return f"line {self.line}, column {self.column}: {self.message}"
+        return self.message
+
+
+def scan(text: str) -> Iterator[Tuple[str, int]]:
+    """
+    Tokenize a text keeping the offset of every token, comments dropped.
+    :param text: Text in trn (trainee).
+    :return: ``(token, offset)`` pairs, the last one is ``END``.
+    """
+    for match in TOKEN_PATTERN.finditer(text):
+        token = match.group(1)
+        yield token, match.start(1)
+        if token == END:
+            break  # after trailing whitespace the end would match a second time
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split a trainee text into tokens in a single pass of the regular expression engine.
+    :param text: Text in trn (trainee).
+    :return: The tokens without comments, followed by ``END``.
+    """
+    tokens = TOKEN_PATTERN.findall(text)
+    if len(tokens) > 1 and tokens[-2] == END:
+        tokens.pop()
+    return tokens
+
+
+class Node(ABC):
+    """
+    Syntax tree node, ``index`` is the position of its first token.
+    """
+    __slots__ = ("index",)
+
+    @abstractmethod
+    def evaluate(self, variables: dict) -> Any:
+        """
+        Compute the value of the node.
+        :param variables: Constants declared so far.
+        :return: Integer, string, list or dictionary.
+        """
+
+
+class Constant(Node):
+    """Integer or string literal."""
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any, index: int):
+        self.index = index
+        self.value = value
+
+    def evaluate(self, variables: dict) -> Any:
+        return self.value
+
+
+class Array(Node):
+    """``{ value. value. }``"""
+    __slots__ = ("items",)
+
+    def __init__(self, items: List[Node], index: int):
+        self.index = index
+        self.items = items
+
+    def evaluate(self, variables: dict) -> list:
+        return [item.evaluate(variables) for item in self.items]
+
+
+class Table(Node):
+    """``[key => value, key => value]``"""
+    __slots__ = ("items",)
+
+    def __init__(self, items: List[Tuple[str, Node]], index: int):
+        self.index = index
+        self.items = items
+
+    def evaluate(self, variables: dict) -> dict:
+        return {key: value.evaluate(variables) for key, value in self.items}
+
+
+class Reference(Node):
+    """Name of a constant declared earlier."""
+    __slots__ = ("name",)
+
+    def __init__(self, name: str, index: int):
+        self.index = index
+        self.name = name
+
+    def evaluate(self, variables: dict) -> Any:
+        if self.name not in variables:
+            raise TrainParseError(f"Undefined name '{self.name}'", self.index)
+        return variables[self.name]
+
+
+class Expression(Node):
+    """``@(operator operand operand)``, the function is looked up once, when parsing."""
+    __slots__ = ("operator", "operands", "function")
+
+    def __init__(self, operator: str, operands: List[Node], index: int):
+        self.index = index
+        self.operator = operator
+        self.operands = operands
+        self.function = CALLABLES[operator][2]
+
+    def evaluate(self, variables: dict) -> Any:
+        operands = [operand.evaluate(variables) for operand in self.operands]
+        try:
+            return self.function(*operands)
+        except (ValueError, TypeError, ZeroDivisionError, OverflowError) as error:
+            raise TrainParseError(str(error), self.index) from None
+
+
+def describe(token: str) -> str:
+    return "end of input" if token == END else repr(token)
+
+
+def is_literal(token: str) -> bool:
+    """Integers, strings and names, the tokens an expression operand can be besides nested expressions."""
+    first = token[:1]
+    return first in DIGITS or first in NAME_START or (first == "-" or first == '"') and len(token) > 1
+
+
+def check_arity(name: str, count: int) -> None:
+    """Raise a ValueError if an operator or a function does not accept ``count`` operands."""
+    if name not in CALLABLES:
+        raise ValueError(f"Unknown operator '{name}'")
+    minimum, maximum, _ = CALLABLES[name]
+    if count < minimum:
+        raise ValueError(f"Insufficient operands for '{name}': expected at least {minimum}, got {count}")
+    if maximum is not None and count > maximum:
+        raise ValueError(f"Too many operands for '{name}': expected at most {maximum}, got {count}")
+
+
+def references(node: Node) -> frozenset:
+    """Names of the constants a value refers to, including inside expressions."""
+    names = set()
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        kind = type(node)
+        if kind is Reference:
+            names.add(node.name)
+        elif kind is Array:
+            stack.extend(node.items)
+        elif kind is Table:
+            stack.extend(value for _, value in node.items)
+        elif kind is Expression:
+            stack.extend(node.operands)
+    return frozenset(names)
+
+
+@lru_cache(maxsize=4096)
+def compile_tokens(tokens: Tuple[str, ...]) -> Node:
+    """
+    Parse a value once per distinct token sequence; constant expressions are already folded.
+    :param tokens: Tokens of one value followed by ``END``, comments and spacing do not matter.
+    :return: The syntax tree, shared by every caller with the same tokens.
+    """
+    return Parser(" ".join(tokens), shared_expressions=False, tokens=tokens).single_value()
+
+
+def compile_value(source: str) -> Node:
+    """
+    Parse a value through the compile_tokens cache.
+    :param source: Text of one value, e.g. ``@(+ a @(* 2 3))``.
+    :return: The syntax tree, shared by every caller with the same tokens.
+    """
+    return compile_tokens(tuple(tokenize(source)))
+
+
+class Parser:
+    """
+    Recursive-descent parser building the syntax tree of a trainee text.
+    Every token is looked at once, so parsing time is linear in the text size.
+    Tokens are plain strings; their line and column are only computed for errors.
+    Top-level ``@( ... )`` expressions are taken from compile_tokens, so an expression
+    repeated in a text or across texts is parsed and folded once. Their token indices
+    count from the start of the expression, not of the text: locate errors with a
+    parser created with ``shared_expressions=False``.
+    """
+    def __init__(self, text: str, shared_expressions: bool = True, tokens: Optional[Tuple[str, ...]] = None):
+        self.text = text
+        self.tokens = tokenize(text) if tokens is None else tokens
+        self.position = 0
+        self.shared_expressions = shared_expressions
+
+    def locate(self, error: TrainParseError) -> TrainParseError:
+        """Fill the line and column of an error raised for this text."""
+        if error.index < 0 or error.line:
+            return error
+        offset = len(self.text)
+        for index, (token, start) in enumerate(scan(self.text)):
+            if index == error.index:
+                offset = start
+                break
+        error.line = self.text.count("\n", 0, offset) + 1
+        error.column = offset - self.text.rfind("\n", 0, offset)
+        return error
+
+    def expect(self, expected: str) -> None:
+        token = self.tokens[self.position]
+        if token != expected:
+            raise TrainParseError(f"Expected {describe(expected)}, got {describe(token)}", self.position)
+        self.position += 1
+
+    def statements(self) -> Iterator[Tuple[str, Node]]:
+        """
+        Parse ``set name = value;`` statements up to the end of the text.
+        :return: The declared names and their values, in text order.
+        """
+        tokens = self.tokens
+        while tokens[self.position] != END:
+            if tokens[self.position] == "(*":
+                raise TrainParseError("Comment not closed with '*)'", self.position)
+            self.expect("set")
+            name = tokens[self.position]
+            if name[:1] not in NAME_START:
+                raise TrainParseError(f"Expected a name, got {describe(name)}", self.position)
+            self.position += 1
+            self.expect("=")
+            value = self.value()
+            self.expect(";")
+            yield name, value
+
+    def single_value(self) -> Node:
+        """Parse a text holding exactly one value."""
+        value = self.value()
+        self.expect(END)
+        return value
+
+    def value(self) -> Node:
+        index = self.position
+        token = self.tokens[index]
+        self.position += 1
+        first = token[:1]
+        if first in DIGITS or first == "-" and len(token) > 1:
+            return Constant(int(token), index)
+        if first in NAME_START:
+            return Reference(token, index)
+        if first == '"':
+            if len(token) == 1:
+                raise TrainParseError("String not closed with '\"'", index)
+            return Constant(sys.intern(token[1:-1]), index)
+        if token == "{":
+            return self.array(index)
+        if token == "[":
+            return self.table(index)
+        if token == "@(":
+            return self.shared_expression(index) if self.shared_expressions else self.expression(index)
+        if token == "(*":
+            raise TrainParseError("Comment not closed with '*)'", index)
+        raise TrainParseError(f"Invalid value {describe(token)}", index)
+
+    def shared_expression(self, opening: int) -> Node:
+        """Take the expression starting at ``opening`` from compile_tokens."""
+        tokens = self.tokens
+        try:
+            # Each ')' closes one '@(', count the ones opened between two ')' until none is left open
+            closing = tokens.index(")", opening)
+            unclosed = tokens[opening + 1:closing].count("@(")
+            while unclosed:
+                start = closing + 1
+                closing = tokens.index(")", start)
+                unclosed += tokens[start:closing].count("@(") - 1
+        except ValueError:
+            return self.expression(opening)  # reports the missing ')'
+        node = compile_tokens((*tokens[opening:closing + 1], END))
+        self.position = closing + 1
+        return node
+
+    # array() and table() keep the position in a local and read strings and integers, the most
+    # common items, themselves; only other values go through value() and self.position
+
+    def array(self, opening: int) -> Array:
+        items = []
+        tokens = self.tokens
+        intern = sys.intern
+        position = self.position
+        while True:
+            token = tokens[position]
+            first = token[:1]
+            if first == '"' and len(token) > 1:
+                items.append(Constant(intern(token[1:-1]), position))
+                position += 1
+            elif first in DIGITS:
+                items.append(Constant(int(token), position))
+                position += 1
+            elif token == "}":
+                break
+            elif token == END:
+                raise TrainParseError("Array not closed with '}'", opening)
+            else:
+                self.position = position
+                items.append(self.value())
+                position = self.position
+            separator = tokens[position]
+            if separator == ".":
+                position += 1
+            elif separator == END:
+                raise TrainParseError("Array not closed with '}'", opening)
+            elif separator != "}":
+                raise TrainParseError(f"Expected '.' or '}}', got {describe(separator)}", position)
+        self.position = position + 1
+        return Array(items, opening)
+
+    def table(self, opening: int) -> Table:
+        items = []
+        tokens = self.tokens
+        intern = sys.intern
+        position = self.position
+        while tokens[position] != "]":
+            key = tokens[position]
+            if key == END:
+                raise TrainParseError("Table not closed with ']'", opening)
+            if key[:1] not in NAME_START:
+                raise TrainParseError(f"Expected a key, got {describe(key)}", position)
+            if tokens[position + 1] != "=>":
+                raise TrainParseError(f"Expected '=>', got {describe(tokens[position + 1])}", position + 1)
+            position += 2
+            token = tokens[position]
+            first = token[:1]
+            if first == '"' and len(token) > 1:
+                items.append((intern(key), Constant(intern(token[1:-1]), position)))
+                position += 1
+            elif first in DIGITS:
+                items.append((intern(key), Constant(int(token), position)))
+                position += 1
+            else:
+                self.position = position
+                items.append((intern(key), self.value()))
+                position = self.position
+            separator = tokens[position]
+            if separator == ",":
+                position += 1
+            elif separator == END:
+                raise TrainParseError("Table not closed with ']'", opening)
+            elif separator != "]":
+                raise TrainParseError(f"Expected ',' or ']', got {describe(separator)}", position)
+        self.position = position + 1
+        return Table(items, opening)
+
+    def expression(self, opening: int) -> Node:
+        """
+        Parse a prefix expression after its ``@(``; operands may be nested ``@( ... )`` expressions.
+        An expression over constants only is folded into a constant.
+        """
+        tokens = self.tokens
+        operator_index = self.position
+        operator_token = tokens[operator_index]
+        if operator_token not in CALLABLES:
+            if operator_token in OPERATORS or operator_token[:1] in NAME_START:
+                raise TrainParseError(f"Unknown operator '{operator_token}'", operator_index)
+            raise TrainParseError(f"Expected an operator or a function, got {describe(operator_token)}", operator_index)
+        self.position += 1
+        operands = []
+        while tokens[self.position] != ")":
+            token = tokens[self.position]
+            if token == END:
+                raise TrainParseError("Expression not closed with ')'", opening)
+            if token == "@(":
+                self.position += 1
+                operands.append(self.expression(self.position - 1))
+            elif is_literal(token):
+                operands.append(self.value())
+            elif token == "(" or token == "(*":
+                # "(*" opens a comment anywhere, so only "@(" can start a nested expression
+                raise TrainParseError(f"Nested expressions start with '@(', got {describe(token)}", self.position)
+            else:
+                raise TrainParseError(f"Unknown token {describe(token)} in expression", self.position)
+        self.position += 1
+        try:
+            check_arity(operator_token, len(operands))
+        except ValueError as error:
+            raise TrainParseError(str(error), opening) from None
+        expression = Expression(operator_token, operands, opening)
+        if all(type(operand) is Constant for operand in operands):
+            try:
+                return Constant(expression.evaluate({}), opening)
+            except TrainParseError:
+                pass  # reported with its location if the value is used
+        return expression
+
+
+class SharedValues:
+    """
+    Hash-consing table: equal arrays and tables are built once and shared, strings are interned.
+    Shared values must be treated as immutable.
+    """
+
+    def __init__(self):
+        self.table: Dict[tuple, Any] = {}
+        self.canonical: Dict[int, Any] = {}  # id -> shared value; the table keeps the ids alive
+
+    @staticmethod
+    def key(value: Any) -> Any:
+        # Children are already shared, so their identity stands for their contents
+        if type(value) is list or type(value) is dict:
+            return id(value)
+        return type(value), value
+
+    def share(self, value: Any) -> Any:
+        """
+        Return the shared copy of a value, registering it if it was not seen yet.
+        :param value: Value produced by Loader.evaluate.
+        :return: A value equal to the given one.
+        """
+        kind = type(value)
+        if kind is str:
+            return sys.intern(value)
+        if kind is not list and kind is not dict:
+            return value
+        if self.canonical.get(id(value)) is value:
+            return value
+        key = self.key
+        if kind is list:
+            items = [self.share(item) for item in value]
+            signature = (list, tuple([key(item) for item in items]))
+        else:
+            items = {sys.intern(name): self.share(item) for name, item in value.items()}
+            signature = (dict, tuple([(name, key(item)) for name, item in items.items()]))
+        shared = self.table.get(signature)
+        if shared is None:
+            shared = self.table[signature] = items
+            self.canonical[id(items)] = items
+        return shared
+
+
+class UnaliasedDumper(YamlDumper):
+    """
+    Dumper writing every shared value in full instead of as an anchor and its aliases.
+    """
+
+    def ignore_aliases(self, data: Any) -> bool:
+        return True
+
+
 # static
 class Loader:
     def __init__(self):
         raise Exception(f"Class {Loader.__name__} is a static class and cannot be instantiated")
 
     @staticmethod
-    def load_trainee(trainee_text: str) -> Any:
+    def load_trainee(trainee_text: str, share: bool = False) -> Any:
         """
         Translates text in the trn (trainee) language into a structure.
         :param trainee_text: Text in trn (trainee).
+        :param share: Build equal arrays and tables once and share them (see SharedValues);
+            the structure must then not be modified.
         :return: Structure filled with data from the read text.
+        :raises TrainParseError: On a syntax error or an invalid constant, with its line and column.
         """
-        # Remove multi-line comments
-        def remove_multiline_comments(text):
-            pattern = r'\(\*.*?\*\)'
-            cleaned_text = re.sub(pattern, '', text, flags=re.DOTALL)
-            return cleaned_text
-
-        cleaned_text = remove_multiline_comments(trainee_text)
-
-        # Initialize a dictionary to hold variables
-        variables = {}
-
-        # Process each line
-        lines = cleaned_text.strip().split('\n')
-        i = 0
-        while i < len(lines):
-            line = lines[i].strip()
-            if not line:
-                i += 1
-                continue  # Skip empty lines
-
-            # Match variable assignment
-            match = re.match(r'^(set)\s*([_a-zA-Z][_a-zA-Z0-9]*)\s*=\s*(.*);$', line)
-            if match:
-                var_name = match.group(2).strip()
-                value_str = match.group(3).strip()
-
-                # Check if it's a table
-                if value_str.startswith('['):
-                    # Start of a table block
-                    table_lines = []
-                    # Remove 'table([' from the line
-                    remainder = value_str[len('['):].strip()
-                    if remainder.endswith(']'):
-                        # Single-line table
-                        table_content = remainder[:-1].strip()
-                        table_lines = [table_content]
-                        i += 1
-                    else:
-                        # Multi-line table
-                        # Add the remainder of the current line if any
-                        if remainder:
-                            table_lines.append(remainder)
-                        i += 1
-                        while i < len(lines):
-                            table_line = lines[i].strip()
-                            if table_line.endswith(']'):
-                                # End of table block
-                                # Remove '])' from the line
-                                table_line = table_line[:-1].strip()
-                                if table_line:
-                                    table_lines.append(table_line)
-                                break
-                            else:
-                                table_lines.append(table_line)
-                            i += 1
-                        else:
-                            raise ValueError("Table definition not closed with ']'")
-
-                    # Combine table lines into a single string and split by commas
-                    table_content = ' '.join(table_lines)
-                    # Split the content by commas, accounting for possible commas within braces or parentheses
-                    items = Loader.split_table_items(table_content)
-
-                    # Parse the table
-                    table = {}
-                    for item in items:
-                        table_line = item.strip()
-                        if not table_line:
-                            continue  # Skip empty items
-                        # Match key-value pairs inside the table
-                        kv_match = re.match(r'^([_a-zA-Z][_a-zA-Z0-9]*)\s*=>\s*(.*)$', table_line)
-                        if kv_match:
-                            key = kv_match.group(1)
-                            value_str = kv_match.group(2).strip()
-
-                            # Parse the value
-                            value = Loader.parse_value(value_str, variables)
-                            table[key] = value
-                        else:
-                            raise ValueError(f"Invalid syntax in table: {table_line}")
-
-                    # Assign the table to the variable
-                    variables[var_name] = table
-                else:
-                    # Parse the value
-                    value = Loader.parse_value(value_str, variables)
-                    # Assign the variable
-                    variables[var_name] = value
-                    i += 1
-            else:
-                raise ValueError(f"Invalid syntax: {line}")
-        return variables
+        for shared_expressions in (True, False):
+            variables = {}
+            parser = Parser(trainee_text, shared_expressions)
+            sharing = SharedValues() if share else None
+            try:
+                for name, node in parser.statements():
+                    value = Loader.evaluate(node, variables)
+                    variables[name] = sharing.share(value) if sharing is not None else value
+                return variables
+            except TrainParseError as error:
+                if shared_expressions:
+                    continue  # the error may come from a shared expression, parse again to locate it in this text
+                raise parser.locate(error)
+            except RecursionError:
+                raise parser.locate(TrainParseError("Values nested too deeply", parser.position)) from None
 
     @staticmethod
-    def split_table_items(table_content):
+    def evaluate(node: Node, variables: dict) -> Any:
         """
-        Split table content into key-value pairs, handling nested structures.
+        Compute the value of a syntax tree node.
+        :param node: Parsed value.
+        :param variables: Constants declared so far.
+        :return: Integer, string, list or dictionary.
+        """
+        return node.evaluate(variables)
+
+    @staticmethod
+    def split_items(content: str, separator: str) -> List[str]:
+        """
+        Split content at the separators that are not nested in brackets, braces or expressions.
         """
         items = []
-        current_item = ''
-        brace_count = 0
-        for char in table_content:
-            if char == '{' or char == '(' or char == '[':
-                brace_count += 1
-            elif char == '}' or char == ')' or char == ']':
-                brace_count -= 1
-            if char == ',' and brace_count == 0:
-                items.append(current_item)
-                current_item = ''
-            else:
-                current_item += char
-        if current_item:
-            items.append(current_item.strip())
+        depth = 0
+        start = 0
+        for token, offset in scan(content):
+            if token in OPENING:
+                depth += 1
+            elif token in CLOSING:
+                depth -= 1
+            elif token == separator and depth == 0:
+                items.append(content[start:offset].strip())
+                start = offset + 1
+        tail = content[start:].strip()
+        if tail:
+            items.append(tail)
         return items
 
+    @staticmethod
+    def split_table_items(table_content):
+        """
+        Split table content into key-value pairs, handling nested structures.
+        """
+        return Loader.split_items(table_content, ",")
+
     @staticmethod
     def parse_value(value_str, variables):
         """
         Parse a value string and return the corresponding Python value.
         """
-        value_str = value_str.strip()
-        if value_str.lstrip("-").isdigit():
-            # Integer value
-            return int(value_str)
-        elif value_str.startswith('\"') and value_str.endswith('\"'):
-            # String value
-            return value_str[1:-1]  # Remove " and ending "
-        elif value_str.startswith('@(') and value_str.endswith(')'):
-            # Expression
-            expr = value_str[2:-1]  # Remove @ and surrounding parentheses
-            tokens = expr.strip().split()
-            return Loader.evaluate_expression(tokens, variables)
-        elif value_str.startswith('{') and value_str.endswith('}'):
-            # Array
-            array_content = value_str[1:-1].strip()  # Remove { and }
-            items = Loader.split_array_items(array_content)
-            value = []
-            for item_str in items:
-                item_value = Loader.parse_value(item_str, variables)
-                value.append(item_value)
-            return value
-        elif value_str in variables:
-            # Variable assignment from another variable
-            return variables[value_str]
-        else:
-            raise ValueError(f"Invalid value: {value_str}")
+        try:
+            return Loader.evaluate(compile_value(value_str.strip()), variables)
+        except TrainParseError as error:
+            raise Parser(value_str.strip()).locate(error)
 
     @staticmethod
     def split_array_items(array_content):
         """
         Split array content into items, handling nested structures.
         """
-        items = []
-        current_item = ''
-        brace_count = 0
-        for char in array_content:
-            if char == '{' or char == '(' or char == '[':
-                brace_count += 1
-            elif char == '}' or char == ')' or char == ']':
-                brace_count -= 1
-            if char == '.' and brace_count == 0:
-                items.append(current_item.strip())
-                current_item = ''
-            else:
-                current_item += char
-        if current_item:
-            items.append(current_item.strip())
-        return items
+        return Loader.split_items(array_content, ".")
 
     @staticmethod
     def evaluate_expression(tokens, constants):
         """
-        Evaluate constant expression in postfix notation.
-        Supports addition and ord() function.
+        Evaluate constant expression in prefix notation.
+        Supports the OPERATORS and FUNCTIONS tables and nested ``@( ... )`` expressions.
         """
-        stack = []
-        first_token = tokens[0]
-        tokens = tokens[1:]
-
-        # Operators and functions
-        operators = {
-            '+': lambda x, y: x + y,
-            '-': lambda x, y: x - y,
-            '*': lambda x, y: x * y,
-            '/': lambda x, y: x / y,
-        }
-
-        functions = {
-            'ord': lambda x: ord(x) if isinstance(x, str) and len(x) == 1 else ValueError("ord() expects a single character"),
-            'abs': lambda x: abs(x) if isinstance(x, int) else ValueError("abs() expects a number"),
-        }
-        for token in tokens:
-            if token.lstrip('-').isdigit():
-                stack.append(int(token))
-            elif token.startswith('\"') and token.endswith('\"'):
-                stack.append(token[1:-1])  # Remove " and "
-            elif token in constants:
-                stack.append(constants[token])
-            else:
-                raise ValueError(f"Unknown token '{token}' in expression")
-        
-        if first_token in operators:
-            if len(stack) < 2:
-                raise ValueError("Insufficient operands for operator")
-            b = stack.pop()
-            a = stack.pop()
-            result = operators[first_token](a, b)
-            stack.append(result)
-        elif first_token in functions:
-            if not stack:
-                raise ValueError("Insufficient operands for function")
-            a = stack.pop()
-            result = functions[first_token](a)
-            if isinstance(result, Exception):
-                raise result
-            stack.append(result)
-        
-        if len(stack) != 1:
-            raise ValueError("Invalid expression")
-        return stack[0]
+        return Loader.parse_value("@(" + " ".join(tokens) + ")", constants)
 
     @staticmethod
-    def get_yaml(struct: Any) -> str:
+    def get_yaml(struct: Any, aliases: bool = True) -> str:
         """
         Translates any type of object with any fields to YAML.
         :param struct: Object to save.
+        :param aliases: Write a value met several times once, as an anchor followed by aliases.
         :return: Configuration in YAML.
         """
-        return yaml.dump(struct, allow_unicode=True)
+        return yaml.dump(struct, Dumper=YamlDumper if aliases else UnaliasedDumper, allow_unicode=True)
+
+    @staticmethod
+    def dump(struct: Any, stream: TextIO, output_format: str = "yaml", aliases: bool = True) -> None:
+        """
+        Writes a structure to an open text file without building the whole document in memory.
+        :param struct: Structure returned by load_trainee.
+        :param stream: File to write to.
+        :param output_format: ``yaml``, ``json`` or ``jsonl`` (one top-level constant per line).
+        :param aliases: As in get_yaml; JSON always repeats shared values.
+        """
+        if output_format == "yaml":
+            yaml.dump(struct, stream, Dumper=YamlDumper if aliases else UnaliasedDumper, allow_unicode=True)
+        elif output_format == "json":
+            json.dump(struct, stream, ensure_ascii=False)
+            stream.write("\n")
+        elif output_format == "jsonl":
+            for name, value in struct.items():
+                stream.write(json.dumps({name: value}, ensure_ascii=False))
+                stream.write("\n")
+        else:
+            raise ValueError(f"Unknown output format: {output_format}")
+
+
+class Statement:
+    """
+    Parsed ``set`` statement of an IncrementalLoader, identified by its source text.
+    """
+    __slots__ = ("source", "name", "node", "references", "position", "bindings", "value")
+
+    def __init__(self, source: str, name: str, node: Node):
+        self.source = source
+        self.name = name
+        self.node = node
+        self.references = references(node)
+        self.position = 0
+        self.bindings: Dict[str, Optional["Statement"]] = {}  # definition seen for every referenced name
+        self.value = UNEVALUATED
+
+
+UNEVALUATED = object()
+
+
+def common_prefix(first: list, second: list) -> int:
+    """Length of the common prefix of two lists, found by comparing slices (in C) in a binary search."""
+    low, high = 0, min(len(first), len(second))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if first[:middle] == second[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+class IncrementalLoader:
+    """
+    Keeps the previous parse of a trainee text and, on an edit, parses only the changed
+    statements and re-evaluates only them and the statements depending on them.
+    Sections are the YAML texts of the top-level constants, re-emitted only when changed.
+    """
+    def __init__(self):
+        self.sources: List[str] = []
+        self.statements: List[Statement] = []
+        self.definers: Dict[str, List[Statement]] = {}  # name -> statements defining it, in order
+        self.users: Dict[str, set] = {}  # name -> statements referencing it
+        self.variables: Dict[str, Any] = {}
+        self.sections: Dict[str, str] = {}
+
+    def update(self, trainee_text: str) -> List[str]:
+        """
+        Load a new version of the text.
+        :param trainee_text: Text in trn (trainee).
+        :return: Sorted names of the constants whose value changed, appeared or disappeared.
+        :raises TrainParseError: As load_trainee does; the next update then starts from scratch.
+        """
+        try:
+            return self.apply_update(trainee_text)
+        except (TrainParseError, RecursionError):
+            previous = self.variables
+            self.__init__()
+            # Locations are only known relative to a statement, the full parse finds the real one
+            variables = Loader.load_trainee(trainee_text)
+            # The text is valid after all: keep the full parse, the next update starts from scratch
+            self.variables = variables
+            self.sections = {name: self.section(name, value) for name, value in variables.items()}
+            return sorted(
+                name for name in previous.keys() | variables.keys()
+                if previous.get(name, UNEVALUATED) != variables.get(name, UNEVALUATED)
+            )
+
+    @staticmethod
+    def split(trainee_text: str) -> List[str]:
+        """Source texts of the statements, each up to its ';'."""
+        sources = []
+        end = 0
+        # Each statement starts where the previous one ended; findall would skip into a trailing comment
+        match = STATEMENT_PATTERN.match(trainee_text)
+        while match is not None:
+            sources.append(match.group())
+            end = match.end()
+            match = STATEMENT_PATTERN.match(trainee_text, end)
+        if tokenize(trainee_text[end:]) != [END]:
+            raise TrainParseError("Invalid syntax")
+        return sources
+
+    @staticmethod
+    def section(name: str, value: Any) -> str:
+        """YAML of one constant, without aliases: anchors would repeat across the sections."""
+        return yaml.dump({name: value}, Dumper=UnaliasedDumper, allow_unicode=True)
+
+    def apply_update(self, trainee_text: str) -> List[str]:
+        sources = self.split(trainee_text)
+        # Only the window between the unchanged first and last statements is new
+        prefix = common_prefix(self.sources, sources)
+        suffix = common_prefix(self.sources[prefix:][::-1], sources[prefix:][::-1])
+        old_window = self.statements[prefix:len(self.statements) - suffix]
+        tail = self.statements[len(self.statements) - suffix:]
+        reusable: Dict[str, List[Statement]] = {}
+        for statement in reversed(old_window):
+            reusable.setdefault(statement.source, []).append(statement)
+        new_window = []
+        for source in sources[prefix:len(sources) - suffix]:
+            candidates = reusable.get(source)
+            new_window.append(candidates.pop() if candidates else self.parse_statement(source))
+
+        window_names = {statement.name for statement in old_window} | {statement.name for statement in new_window}
+        previous_definers = {name: self.definers[name][-1] for name in window_names if name in self.definers}
+        previous_first = {name: self.definers[name][0].position for name in window_names if name in self.definers}
+        delta = len(new_window) - len(old_window)
+        if delta:
+            for statement in tail:
+                statement.position += delta
+        for offset, statement in enumerate(new_window):
+            statement.position = prefix + offset
+
+        # Reindex the definitions and references of the window
+        old_set = set(map(id, old_window))
+        for statement in old_window:
+            for name in statement.references:
+                self.users[name].discard(statement)
+        new_definers: Dict[str, List[Statement]] = {}
+        for statement in new_window:
+            new_definers.setdefault(statement.name, []).append(statement)
+        for name in window_names:
+            definers = [statement for statement in self.definers.get(name, ()) if id(statement) not in old_set]
+            definers.extend(new_definers.get(name, ()))
+            definers.sort(key=lambda statement: statement.position)
+            if definers:
+                self.definers[name] = definers
+            else:
+                del self.definers[name]
+        for statement in new_window:
+            for name in statement.references:
+                self.users.setdefault(name, set()).add(statement)
+
+        # Re-evaluate in text order the window and whatever may see another definition or value
+        pending = [(statement.position, statement) for statement in new_window]
+        for name in window_names:
+            pending.extend((user.position, user) for user in self.users.get(name, ()) if user.position >= prefix)
+        queued = {id(statement): statement for _, statement in pending}
+        pending = [(position, id(statement)) for position, statement in pending]
+        heapq.heapify(pending)
+        reevaluated = set()
+        while pending:
+            statement = queued[heapq.heappop(pending)[1]]
+            bindings = {name: self.definition(name, statement.position) for name in statement.references}
+            if (
+                statement.value is not UNEVALUATED
+                and all(bindings[name] is statement.bindings.get(name) for name in bindings)
+                and not any(id(target) in reevaluated for target in bindings.values() if target is not None)
+            ):
+                continue
+            scope = {name: target.value for name, target in bindings.items() if target is not None}
+            value = statement.node.evaluate(scope)
+            statement.bindings = bindings
+            statement.value = value
+            reevaluated.add(id(statement))
+            for user in self.users.get(statement.name, ()):
+                if user.position > statement.position and id(user) not in queued:
+                    queued[id(user)] = user
+                    heapq.heappush(pending, (user.position, id(user)))
+
+        changed = set()
+        for name in window_names:
+            definers = self.definers.get(name)
+            if definers is None or definers[-1] is not previous_definers.get(name):
+                changed.add(name)
+        for key in reevaluated:
+            statement = queued[key]
+            if self.definers[statement.name][-1] is statement:
+                changed.add(statement.name)
+
+        starting_over = not self.statements
+        if starting_over:
+            # Compare with the constants shown before, e.g. the full parse kept by update()
+            changed = {
+                name for name in self.variables.keys() | self.definers.keys()
+                if name not in self.definers or self.variables.get(name, UNEVALUATED) != self.definers[name][-1].value
+            }
+
+        self.sources = sources
+        self.statements = self.statements[:prefix] + new_window + tail
+        # Constants keep the order of their first definition, as in load_trainee
+        if not starting_over and delta == 0 and all(
+            name in self.definers and self.definers[name][0].position == previous_first.get(name) for name in window_names
+        ):
+            for name in changed:
+                self.variables[name] = self.definers[name][-1].value
+        else:
+            names = sorted(self.definers, key=lambda name: self.definers[name][0].position)
+            self.variables = {name: self.definers[name][-1].value for name in names}
+        for name in changed:
+            if name in self.definers:
+                self.sections[name] = self.section(name, self.variables[name])
+            else:
+                self.sections.pop(name, None)
+        return sorted(changed)
+
+    def definition(self, name: str, position: int) -> Optional[Statement]:
+        """The last statement defining a name before a position."""
+        for statement in reversed(self.definers.get(name, ())):
+            if statement.position < position:
+                return statement
+        return None
+
+    @staticmethod
+    def parse_statement(source: str) -> Statement:
+        parsed = list(Parser(source).statements())
+        if len(parsed) != 1:
+            raise TrainParseError("Invalid syntax")
+        name, node = parsed[0]
+        return Statement(source, name, node)
+
+    def get_yaml(self) -> str:
+        """
+        The YAML of all the constants, assembled from the cached sections.
+        Values met several times are written in full, as with ``Loader.get_yaml(..., aliases=False)``.
+        """
+        return "".join(self.sections[name] for name in sorted(self.sections))
+
+
+def write_atomically(path: str, write: Callable[[TextIO], Any]) -> None:
+    """
+    Writes a file through a temporary file of the same directory, so readers never see it half written.
+    :param path: File to write.
+    :param write: Called with the open temporary file.
+    """
+    descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as file:
+            write(file)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def has_magic(pattern: str) -> bool:
+    return any(char in pattern for char in "*?[")
+
+
+def collect_sources(patterns: List[str]) -> Dict[str, str]:
+    """
+    Expands the inputs of a batch: directories (searched recursively for SOURCE_SUFFIXES), globs and files.
+    :return: Normalized source paths, in the order given, mapped to their path relative to the
+        directory or to the non-wildcard part of the glob they were found in.
+    """
+    sources = {}
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            base = pattern
+            paths = []
+            for root, directories, names in os.walk(pattern):
+                directories.sort()
+                paths.extend(os.path.join(root, name) for name in sorted(names) if name.endswith(SOURCE_SUFFIXES))
+        elif has_magic(pattern):
+            base = os.path.dirname(pattern)
+            while has_magic(base):
+                base = os.path.dirname(base)
+            paths = sorted(glob.glob(pattern, recursive=True))
+        else:
+            base = os.path.dirname(pattern)
+            paths = [pattern]
+        for path in paths:
+            sources.setdefault(os.path.normpath(path), os.path.relpath(path, base or os.curdir))
+    return sources
+
+
+def batch_output_path(source: str, relative: str, output_dir: Optional[str], output_format: str) -> str:
+    """Output of a source: next to it, or at its relative path under ``output_dir``."""
+    if output_dir is not None:
+        source = os.path.join(output_dir, relative)
+    return os.path.splitext(source)[0] + OUTPUT_FORMATS[output_format]
+
+
+def convert_source(job: Tuple[str, str, str, Optional[str]]) -> Tuple[str, str, int, str]:
+    """
+    Converts one file of a batch, unless its hash is the one recorded by the previous batch.
+    Runs in the worker processes.
+    :param job: Source, output path, output format and previous SHA-256 of the source (or None).
+    :return: Source, SHA-256, size in bytes and ``converted``, ``cached`` or the error message.
+    """
+    source, output_path, output_format, previous_hash = job
+    digest = ""
+    size = 0
+    try:
+        with open(source, 'rb') as file:
+            data = file.read()
+        digest = hashlib.sha256(data).hexdigest()
+        size = len(data)
+        if digest == previous_hash and os.path.exists(output_path):
+            return source, digest, size, "cached"
+        struct = Loader.load_trainee(data.decode('utf-8'))
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        write_atomically(output_path, lambda file: Loader.dump(struct, file, output_format))
+        return source, digest, size, "converted"
+    except Exception as e:
+        return source, digest, size, f"{type(e).__name__}: {e}"
+
+
+def batch_convert(
+    patterns: List[str],
+    output_dir: Optional[str] = None,
+    output_format: str = "yaml",
+    processes: Optional[int] = None,
+    manifest_path: str = DEFAULT_MANIFEST,
+) -> Dict[str, Any]:
+    """
+    Converts many trainee files across a process pool.
+    Files whose SHA-256 matches the manifest of the previous batch are skipped.
+    :param patterns: Directories, globs or files.
+    :param output_dir: Root of the outputs, next to the sources by default.
+    :param output_format: ``yaml``, ``json`` or ``jsonl``.
+    :param processes: Size of the pool, the number of CPUs by default.
+    :param manifest_path: JSON file recording the hash and the output of every converted source.
+    :return: Counts, errors and throughput of the batch.
+    """
+    start = time.perf_counter()
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        manifest = {}
+
+    jobs = []
+    for source, relative in collect_sources(patterns).items():
+        output_path = batch_output_path(source, relative, output_dir, output_format)
+        entry = manifest.get(source, {})
+        unchanged = entry.get("output") == output_path and entry.get("format") == output_format
+        jobs.append((source, output_path, output_format, entry.get("sha256") if unchanged else None))
+
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(jobs) < 2:
+        results = [convert_source(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(convert_source, jobs, chunksize=max(1, len(jobs) // (processes * 4))))
+
+    summary = {"files": len(jobs), "converted": 0, "cached": 0, "errors": {}, "bytes": 0}
+    for (source, output_path, _, _), (_, digest, size, status) in zip(jobs, results):
+        summary["bytes"] += size
+        if status in ("converted", "cached"):
+            summary[status] += 1
+            manifest[source] = {"sha256": digest, "output": output_path, "format": output_format}
+        else:
+            summary["errors"][source] = status
+            manifest.pop(source, None)
+    write_atomically(manifest_path, lambda file: json.dump(manifest, file, indent=1, sort_keys=True))
+
+    elapsed = time.perf_counter() - start
+    summary["seconds"] = elapsed
+    summary["files_per_second"] = len(jobs) / elapsed if elapsed else 0.0
+    summary["megabytes_per_second"] = summary["bytes"] / 1e6 / elapsed if elapsed else 0.0
+    return summary
+
+
+def watch(input_path: str, output_path: str, output_format: str = "yaml", interval: float = 0.2) -> None:
+    """
+    Regenerates the output every time the input file is saved, until interrupted.
+    :param input_path: Text in trn (trainee).
+    :param output_path: File to write.
+    :param output_format: ``yaml``, ``json`` or ``jsonl``.
+    :param interval: Seconds between two checks of the input modification time.
+    """
+    loader = IncrementalLoader()
+    modified = None
+    while True:
+        current = os.stat(input_path).st_mtime_ns
+        if current != modified:
+            modified = current
+            start = time.perf_counter()
+            try:
+                with open(input_path, 'r', encoding='utf-8') as file:
+                    changed = loader.update(file.read())
+                if output_format == "yaml":
+                    write_atomically(output_path, lambda file: file.write(loader.get_yaml()))
+                else:
+                    write_atomically(output_path, lambda file: Loader.dump(loader.variables, file, output_format))
+                elapsed = (time.perf_counter() - start) * 1000
+                print(f"{len(changed)} constants changed, {output_path} updated in {elapsed:.1f} ms")
+            except TrainParseError as e:
+                print(f"An error occurred: {e}")
+        time.sleep(interval)
+
 
 if __name__ == "__main__":
-    test_file_path = "input.txt"
+    parser = argparse.ArgumentParser(description="Translator of the trainee configuration language")
+    parser.add_argument(
+        "input", nargs="*", default=["input.txt"],
+        help="Text in trn (trainee), '-' for standard input; directories and globs with --batch"
+    )
+    parser.add_argument(
+        "-o", "--output",
+        help="Output file, '-' for standard output, output.<format> by default; output directory with --batch"
+    )
+    parser.add_argument("-f", "--format", choices=OUTPUT_FORMATS, default="yaml", help="Output format")
+    parser.add_argument("-w", "--watch", action="store_true", help="Regenerate the output whenever the input is saved")
+    parser.add_argument("-b", "--batch", action="store_true", help="Convert every input file across a process pool")
+    parser.add_argument("-j", "--jobs", type=int, help="Processes of the batch, the number of CPUs by default")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST, help="Source hashes of the previous batch")
+    parser.add_argument("--share", action="store_true", help="Build equal arrays and tables once and share them")
+    parser.add_argument("--no-aliases", action="store_true", help="Write shared values in full in YAML")
+    args = parser.parse_args()
+
+    if args.batch:
+        summary = batch_convert(args.input, args.output, args.format, args.jobs, args.manifest)
+        for source, error in summary["errors"].items():
+            print(f"{source}: {error}")
+        print(
+            f"{summary['files']} files ({summary['converted']} converted, {summary['cached']} cache hits, "
+            f"{len(summary['errors'])} errors) in {summary['seconds']:.2f} s: "
+            f"{summary['files_per_second']:.1f} files/s, {summary['megabytes_per_second']:.2f} MB/s"
+        )
+        sys.exit(1 if summary["errors"] else 0)
+
+    if len(args.input) > 1:
+        parser.error("several inputs need --batch")
+    input_path = args.input[0]
+    output_path = args.output or "output" + OUTPUT_FORMATS[args.format]
+
+    if args.watch:
+        try:
+            watch(input_path, output_path, args.format)
+        except KeyboardInterrupt:
+            pass
+        sys.exit()
 
     try:
-        with open(test_file_path, 'r', encoding='utf-8') as file:
-            trainee_text = file.read()
+        if input_path == "-":
+            trainee_text = sys.stdin.read()
+        else:
+            with open(input_path, 'r', encoding='utf-8') as file:
+                trainee_text = file.read()
 
-        struct = Loader.load_trainee(trainee_text)
+        struct = Loader.load_trainee(trainee_text, args.share)
+        aliases = not args.no_aliases
 
-        if struct is not None:
-            yaml_output = Loader.get_yaml(struct)
-            print(yaml_output)
-            with open("output.yaml", 'w', encoding='utf-8') as file:
-                file.write(yaml_output)
+        if output_path == "-":
+            Loader.dump(struct, sys.stdout, args.format, aliases)
         else:
-            print("Failed to parse the configuration.")
+            write_atomically(output_path, lambda file: Loader.dump(struct, file, args.format, aliases))
+            print(f"Saved to {output_path}")
 
     except FileNotFoundError:
-        print(f"File '{test_file_path}' not found.")
+        print(f"File '{input_path}' not found.")
     except Exception as e:
-        print(f"An error occurred: {e}")
\ No newline at end of file
+        print(f"An error occurred: {e}")
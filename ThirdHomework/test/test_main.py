@@ -1,5 +1,11 @@
+import io
+import json
+import os
+import tempfile
 import unittest
-from main import Loader
+from unittest import mock
+import yaml
+from main import Constant, Expression, IncrementalLoader, Loader, TrainParseError, batch_convert, compile_tokens, compile_value
 
 class TestLoader(unittest.TestCase):
     def test_load_trainee(self):
@@ -69,5 +75,179 @@ class TestLoader(unittest.TestCase):
         # Function usage (ord)
         self.assertEqual(Loader.evaluate_expression(["ord", "\"A\""], constants), 65)
 
+    def test_nested_values(self):
+        trainee_text = """
+        set inner = [a => 1];
+        set table = [
+            arr => { 1. { 2. [b => "x"]. }. inner. },
+            expr => @(* 2 3),
+        ];
+        """
+        result = Loader.load_trainee(trainee_text)
+        self.assertEqual(result['table'], {'arr': [1, [2, {'b': "x"}], {'a': 1}], 'expr': 6})
+
+    def test_syntax_errors(self):
+        cases = [
+            ("set a = 1;\nset b = { 1. 2 3 };", 2, 16),
+            ("(* comment\n*) set a = q;", 2, 12),
+            ("set a = 1;\n  (* not closed", 2, 3),
+            ("set a = [k => 1", 1, 9),
+            ("set a = 1; (* trailing *)\n set b   ", 2, 10),
+            ("set a = 1;\nset b = [k => @(+ a missing)];", 2, 21),
+            ("set y = 1;\nset a = @(+ 1 y);\nset y = \"s\";\nset b = @(+ 1 y);", 4, 9),
+        ]
+        for trainee_text, line, column in cases:
+            with self.assertRaises(TrainParseError) as context:
+                Loader.load_trainee(trainee_text)
+            self.assertEqual((context.exception.line, context.exception.column), (line, column))
+
+    def test_expressions(self):
+        constants = {'num': 5, 'text': "ab"}
+
+        # Variadic operators and negation
+        self.assertEqual(Loader.evaluate_expression(["+", "1", "2", "num"], constants), 8)
+        self.assertEqual(Loader.evaluate_expression(["-", "num"], constants), -5)
+
+        # Nested expressions
+        self.assertEqual(Loader.parse_value("@(* @(+ num 1) @(- 10 8))", constants), 12)
+        self.assertEqual(Loader.parse_value("@(+ 1 @(* 2 3))", constants), 7)
+        # "(*" opens a comment, only "@(" starts a nested expression
+        for value in ("@(+ 1 (* 2 3))", "@(+ 1 (- 2 3))"):
+            with self.assertRaises(TrainParseError) as context:
+                Loader.parse_value(value, constants)
+            self.assertIn("Nested expressions start with '@('", str(context.exception))
+
+        # Functions
+        self.assertEqual(Loader.parse_value("@(max 3 num 4)", constants), 5)
+        self.assertEqual(Loader.parse_value("@(concat text @(chr 67) @(len text))", constants), "abC2")
+        self.assertEqual(Loader.parse_value("@(mod @(pow 2 10) 1000)", constants), 24)
+
+        with self.assertRaises(TrainParseError):
+            Loader.evaluate_expression(["abs", "1", "2"], constants)
+        with self.assertRaises(TrainParseError):
+            Loader.evaluate_expression(["sqrt", "4"], constants)
+
+    def test_constant_folding(self):
+        node = compile_value("@(+ 1 @(* 2 3))")
+        self.assertIsInstance(node, Constant)
+        self.assertEqual(node.value, 7)
+        self.assertIs(compile_value("@(+ 1 @(* 2 3))"), node)
+        self.assertIsInstance(compile_value("@(+ num 1)"), Expression)
+
+        # load_trainee parses every distinct expression once, whatever its spacing and comments
+        compile_tokens.cache_clear()
+        result = Loader.load_trainee("set x = 2;\nset a = @(* x 512);\nset b = { @(* x   512). @(* (* c *) x 512) };")
+        self.assertEqual(result, {'x': 2, 'a': 1024, 'b': [1024, 1024]})
+        self.assertEqual((compile_tokens.cache_info().misses, compile_tokens.cache_info().hits), (1, 2))
+
+    def test_incremental_loader(self):
+        trainee_text = """
+        (* comment; with a semicolon *)
+        set a = 1;
+        set b = @(+ a 1);
+        set c = { b. "x;y" };
+        set d = 5;
+        """
+        loader = IncrementalLoader()
+        self.assertEqual(loader.update(trainee_text), ['a', 'b', 'c', 'd'])
+        self.assertEqual(loader.update(trainee_text), [])
+
+        # Only the edited constant and its dependents change
+        edited = trainee_text.replace("set a = 1;", "set a = 10;")
+        self.assertEqual(loader.update(edited), ['a', 'b', 'c'])
+        self.assertEqual(loader.variables, Loader.load_trainee(edited))
+        self.assertEqual(loader.update(edited.replace("set d = 5;", "set d = 6;")), ['d'])
+
+        # A later redefinition is seen by the statements after it only
+        redefined = edited.replace("set d = 5;", "set d = 5;\n        set a = 2;")
+        self.assertEqual(loader.update(redefined), ['a', 'd'])
+        self.assertEqual(loader.variables, Loader.load_trainee(redefined))
+        expected = "".join(
+            Loader.get_yaml({name: value}, aliases=False) for name, value in sorted(loader.variables.items())
+        )
+        self.assertEqual(loader.get_yaml(), expected)
+
+        with self.assertRaises(TrainParseError) as context:
+            loader.update(redefined + "set e = missing;")
+        self.assertEqual(context.exception.line, 8)
+        self.assertEqual(loader.update(trainee_text), ['a', 'b', 'c', 'd'])
+
+        # "@(*" is an expression, not a comment swallowing the ';' after it
+        expression_first = "set b = @(* 2 3); (* c; *) set f = 1; (* trailing; *)"
+        self.assertEqual(loader.update(expression_first), ['a', 'b', 'c', 'd', 'f'])
+        self.assertEqual(loader.variables, Loader.load_trainee(expression_first))
+
+        # Sections written in full, so the document has no repeated anchor
+        shared = "set a = {1. 2.}; set b = [x => a, y => a]; set c = [p => a, q => a];"
+        loader.update(shared)
+        self.assertEqual(yaml.safe_load(loader.get_yaml()), Loader.load_trainee(shared))
+
+        # A valid text is loaded in full when the incremental path fails
+        with mock.patch.object(IncrementalLoader, "split", side_effect=TrainParseError("Invalid syntax")):
+            self.assertEqual(loader.update(trainee_text), ['a', 'b', 'c', 'd'])
+        self.assertEqual(loader.variables, Loader.load_trainee(trainee_text))
+        self.assertEqual(loader.update(trainee_text.replace("set d = 5;", "")), ['d'])
+        self.assertEqual(loader.get_yaml(), Loader.get_yaml(loader.variables, aliases=False))
+
+    def test_batch_convert(self):
+        with tempfile.TemporaryDirectory() as directory:
+            sources = os.path.join(directory, "configs")
+            os.makedirs(os.path.join(sources, "nested"))
+            for index in range(4):
+                with open(os.path.join(sources, f"config{index}.trn"), 'w', encoding='utf-8') as file:
+                    file.write(f"set value = @(+ {index} 1);")
+            with open(os.path.join(sources, "nested", "broken.trn"), 'w', encoding='utf-8') as file:
+                file.write("set value = ;")
+            output = os.path.join(directory, "out")
+            manifest = os.path.join(directory, "manifest.json")
+
+            summary = batch_convert([sources], output, "json", processes=2, manifest_path=manifest)
+            self.assertEqual((summary["files"], summary["converted"], summary["cached"]), (5, 4, 0))
+            self.assertEqual(list(summary["errors"]), [os.path.join(sources, "nested", "broken.trn")])
+            self.assertFalse(os.path.exists(os.path.join(output, "nested", "broken.json")))
+            with open(os.path.join(output, "config2.json"), encoding='utf-8') as file:
+                self.assertEqual(json.load(file), {'value': 3})
+
+            with open(os.path.join(sources, "config0.trn"), 'w', encoding='utf-8') as file:
+                file.write("set value = 10;")
+            summary = batch_convert([os.path.join(sources, "*.trn")], output, "json", processes=2, manifest_path=manifest)
+            self.assertEqual((summary["files"], summary["converted"], summary["cached"]), (4, 1, 3))
+            self.assertEqual([name for name in os.listdir(directory) if name.endswith(".tmp")], [])
+
+    def test_dump(self):
+        struct = {'b': [1, {'c': "ъ"}], 'a': 2}
+        outputs = {}
+        for output_format in ("yaml", "json", "jsonl"):
+            stream = io.StringIO()
+            Loader.dump(struct, stream, output_format)
+            outputs[output_format] = stream.getvalue()
+        self.assertEqual(outputs["yaml"], Loader.get_yaml(struct))
+        self.assertEqual(json.loads(outputs["json"]), struct)
+        self.assertEqual(outputs["jsonl"], '{"b": [1, {"c": "ъ"}]}\n{"a": 2}\n')
+        with self.assertRaises(ValueError):
+            Loader.dump(struct, io.StringIO(), "xml")
+
+    def test_shared_values(self):
+        trainee_text = """
+        set a = [ x => { 1. "s" }, y => 2 ];
+        set b = [ x => { 1. "s" }, y => 2 ];
+        set c = { @(+ 1 1). [ x => { 1. "s" }, y => 2 ] };
+        """
+        plain = Loader.load_trainee(trainee_text)
+        shared = Loader.load_trainee(trainee_text, share=True)
+        self.assertEqual(shared, plain)
+        self.assertIsNot(plain['a'], plain['b'])
+        self.assertIs(shared['a'], shared['b'])
+        self.assertIs(shared['c'][1], shared['a'])
+        self.assertIs(shared['a']['x'][1], plain['b']['x'][1])
+
+        # Shared values become anchors and aliases unless aliases are turned off
+        self.assertIn("*id001", Loader.get_yaml(shared))
+        self.assertEqual(Loader.get_yaml(shared, aliases=False), Loader.get_yaml(plain))
+        stream = io.StringIO()
+        Loader.dump(shared, stream, "yaml", aliases=False)
+        self.assertEqual(stream.getvalue(), Loader.get_yaml(plain))
+
+
 if __name__ == "__main__":
     unittest.main()